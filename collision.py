@@ -0,0 +1,93 @@
+'''
+Collisions with static walls, without arcade. Walls are axis-aligned rectangles bucketed once into a uniform
+grid, so a query only looks at the walls in the cells it overlaps: its cost depends on how crowded the
+map is around the car, not how many walls there are in total.
+'''
+
+import math
+
+class WallGrid:
+    def __init__(self, rects, cell_size=128):
+        '''
+        rects: (left, bottom, right, top) of every wall, in pixels
+        cell_size: width and height of a grid cell in pixels, about the size of a car or a few walls
+        '''
+        assert cell_size > 0, 'cell_size <= 0'
+        self.cell_size = cell_size
+        self.rects = [tuple(map(float, rect)) for rect in rects]
+        self._cells = {} # (column, row) -> indices of the walls overlapping that cell
+        for i, rect in enumerate(self.rects):
+            for cell in self._cells_of(*rect):
+                self._cells.setdefault(cell, []).append(i)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def _cells_of(self, left, bottom, right, top):
+        size = self.cell_size
+        columns = range(math.floor(left / size), math.floor(right / size) + 1)
+        for row in range(math.floor(bottom / size), math.floor(top / size) + 1):
+            for column in columns:
+                yield column, row
+
+    def query(self, left, bottom, right, top):
+        '''Indices of the walls overlapping the rectangle (touching edges don't count)'''
+        hits = []
+        cells = self._cells
+        rects = self.rects
+        for cell in self._cells_of(left, bottom, right, top):
+            for i in cells.get(cell, ()):
+                wall_left, wall_bottom, wall_right, wall_top = rects[i]
+                if wall_left < right and wall_right > left and wall_bottom < top and wall_top > bottom \
+                        and i not in hits:
+                    hits.append(i)
+        return hits
+
+    def collides(self, left, bottom, right, top):
+        return bool(self.query(left, bottom, right, top))
+
+    def move(self, x, y, dx, dy, half_width, half_height):
+        '''
+        Where a box centred on (x, y) ends up moving by (dx, dy): along x, then along y, stopping against
+        the first wall in the way on each axis, like arcade.PhysicsEngineSimple. Walls the box already
+        overlaps don't stop it, so it can drive out of them. Returns the new (x, y).
+        '''
+        x = self._move_axis(x, y, dx, half_width, half_height, 0)
+        y = self._move_axis(y, x, dy, half_height, half_width, 1)
+        return x, y
+
+    def _move_axis(self, position, other, delta, half_size, half_other, axis):
+        if not delta:
+            return position
+        def box(at):
+            low, high = at - half_size, at + half_size
+            if axis == 0:
+                return low, other - half_other, high, other + half_other
+            return other - half_other, low, other + half_other, high
+
+        hits = self.query(*box(position + delta))
+        if not hits:
+            return position + delta
+        already = self.query(*box(position))
+        hits = [i for i in hits if i not in already]
+        if not hits:
+            return position + delta
+        # Stop against the nearest wall. The box's edge is worked out from its centre again, and rounding can
+        # leave it a hair inside the wall, which would then no longer stop it, so step back until it isn't
+        if delta > 0:
+            edge = min(self.rects[i][axis] for i in hits)
+            stop = edge - half_size
+            while stop + half_size > edge:
+                stop = math.nextafter(stop, -math.inf)
+            return max(position, stop)
+        edge = max(self.rects[i][axis + 2] for i in hits)
+        stop = edge + half_size
+        while stop - half_size < edge:
+            stop = math.nextafter(stop, math.inf)
+        return min(position, stop)
+
+def half_extent(width, height, angle):
+    '''Half the width and height of the axis-aligned box around a width x height rectangle turned `angle` degrees'''
+    radians = math.radians(angle)
+    cos, sin = abs(math.cos(radians)), abs(math.sin(radians))
+    return (width * cos + height * sin) / 2, (width * sin + height * cos) / 2
@@ -0,0 +1,156 @@
+'''
+Where AudioDevice streams go. A backend opens streams that call
+`callback(frame_count, underflow, overflow)` for each block of int16 samples:
+
+PyAudioBackend: the sound card, through PortAudio
+NullBackend: no sound card, a simulated clock calls the callback at the device's block size and rate,
+  and the audio is written to a .wav file or thrown away. For headless machines and soak tests
+'''
+
+import threading
+import time
+import wave
+
+class PyAudioBackend:
+    realtime = True # callbacks are paced by the sound card's clock
+
+    def __init__(self):
+        import pyaudio # only needed for real audio, so headless machines can run without it
+        self._pyaudio_module = pyaudio
+        self._pyaudio = pyaudio.PyAudio()
+
+    def open_stream(self, callback, channels, sample_rate, block_size):
+        pyaudio = self._pyaudio_module
+        def callback_wrapped(in_data, frame_count, time_info, status_flags):
+            samples = callback(frame_count, bool(status_flags & pyaudio.paOutputUnderflow),
+                               bool(status_flags & pyaudio.paOutputOverflow))
+            return (samples, pyaudio.paContinue)
+
+        return self._pyaudio.open(
+            format=pyaudio.paInt16,
+            channels=channels,
+            rate=sample_rate,
+            frames_per_buffer=block_size or pyaudio.paFramesPerBufferUnspecified,
+            output=True,
+            stream_callback=callback_wrapped
+        )
+
+    def terminate(self):
+        self._pyaudio.terminate()
+
+class NullBackend:
+    def __init__(self, path=None, realtime=True, block_size=512):
+        '''
+        path: .wav file to write everything played to, None to throw it away
+        realtime: if True, streams call back from their own thread, paced by the wall clock like a sound card.
+          If False, nothing plays until stream.run(seconds) is called, which renders as fast as it can
+        block_size: frames per callback when the AudioDevice doesn't set one
+        '''
+        self.path = path
+        self.realtime = realtime
+        self.block_size = block_size
+
+    def open_stream(self, callback, channels, sample_rate, block_size):
+        stream = SimulatedStream(callback, channels, sample_rate, block_size or self.block_size, self.path)
+        if self.realtime:
+            stream.start()
+        return stream
+
+    def terminate(self):
+        pass
+
+class SimulatedStream:
+    def __init__(self, callback, channels, sample_rate, block_size, path=None):
+        '''
+        Calls `callback` a block at a time on a simulated clock. A callback that returns later than the
+        device would have run out of audio counts as an underflow, and is reported to the next callback
+        like PortAudio does.
+        '''
+        self._callback = callback
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self._wav = None
+        if path is not None:
+            self._wav = wave.open(str(path), 'wb')
+            self._wav.setnchannels(channels)
+            self._wav.setsampwidth(2) # int16
+            self._wav.setframerate(sample_rate)
+
+        self.clock = 0.0 # simulated seconds played
+        self.blocks = 0
+        self.underflows = 0
+        self._underflow = False
+        self._running = False
+        self._thread = None
+        self._lock = threading.Lock() # so run() and close() can't overlap with the realtime thread
+
+    def _play_block(self):
+        start = time.perf_counter()
+        samples = self._callback(self.block_size, self._underflow, False)
+        duration = time.perf_counter() - start
+        assert len(samples) == self.block_size * self.channels, 'callback returned the wrong number of samples'
+        if self._wav is not None:
+            self._wav.writeframes(samples.astype('<i2', copy=False).tobytes())
+        self.clock += self.block_size / self.sample_rate
+        self.blocks += 1
+        return duration
+
+    def run(self, seconds):
+        '''Plays `seconds` of audio as fast as possible, a callback that takes longer than its block is an underflow'''
+        with self._lock:
+            budget = self.block_size / self.sample_rate
+            end = self.clock + seconds
+            while self.clock < end:
+                self._underflow = self._play_block() > budget
+                self.underflows += self._underflow
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run_realtime, daemon=True)
+        self._thread.start()
+
+    def _run_realtime(self):
+        # Like a double-buffered sound card: each block is asked for when the one before it starts
+        # playing, and has to be ready by the time that one has played
+        budget = self.block_size / self.sample_rate
+        deadline = time.perf_counter() + budget
+        while self._running:
+            with self._lock:
+                self._play_block()
+                now = time.perf_counter()
+                self._underflow = now > deadline
+                self.underflows += self._underflow
+            if self._underflow:
+                deadline = now + budget # the device played silence meanwhile, it doesn't catch up
+            else:
+                time.sleep(deadline - now)
+                deadline += budget
+
+    def is_active(self):
+        return self._running
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._wav is not None:
+                self._wav.close()
+                self._wav = None
+
+def create(name=None):
+    '''
+    Backend by name, e.g. from a command line option or environment variable: 'pyaudio' (default),
+    'null', or a path ending in .wav for a NullBackend that writes to it. A backend object is returned as is
+    '''
+    if not (name is None or isinstance(name, str)):
+        return name
+    if name in (None, '', 'pyaudio'):
+        return PyAudioBackend()
+    if name == 'null':
+        return NullBackend()
+    if name.endswith('.wav'):
+        return NullBackend(path=name)
+    raise ValueError(f"Unknown audio backend {name!r}, should be 'pyaudio', 'null' or a .wav path")
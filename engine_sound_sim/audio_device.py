@@ -1,22 +1,157 @@
 from engine_sound_sim import cfg
+from engine_sound_sim import audio_backend
+from engine_sound_sim.ring_buffer import RingBuffer
 
-import pyaudio
+import math
+import threading
+import time
+import traceback
+import numpy as np
+
+class AudioProducer:
+    def __init__(self, callback, ahead_ms=50, block_size=256, channels=1, sample_rate=None, threaded=True):
+        '''
+        Calls `callback` on a worker thread to keep `ahead_ms` of audio rendered ahead of the audio device,
+        so the device's callback only has to copy samples out and slow synthesis doesn't cause glitches.
+        The audio heard is up to `ahead_ms` behind the latest RPM.
+
+        callback: function taking a number of frames and returning that many int16 samples per channel
+          (interleaved when there's more than one)
+        ahead_ms: how much audio to keep rendered, in milliseconds. Should be more than one device callback's worth
+        block_size: number of frames asked of `callback` at a time
+        sample_rate: defaults to cfg.sample_rate
+        threaded: if False, there's no worker thread and read() tops the queue up before taking samples from it,
+          for streams on a simulated clock (audio_backend.NullBackend(realtime=False)), where a thread on the
+          wall clock would fall behind by a different amount every run
+        '''
+        assert ahead_ms > 0, 'ahead_ms <= 0'
+        self._callback = callback
+        self.block_size = block_size
+        self.channels = channels
+        self.sample_rate = sample_rate or cfg.sample_rate
+        self.threaded = threaded
+        self.ahead_samples = math.ceil(ahead_ms / 1000 * self.sample_rate) * channels
+
+        self._queue = RingBuffer(self.ahead_samples + block_size * channels)
+        self._out_buffer = np.zeros(1024, dtype=np.int16)
+        self._lock = threading.Lock() # only held while samples are copied in or out of the queue
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+        self.underruns = 0 # times the device asked for more samples than were rendered
+        self.error = None # exception `callback` raised on the worker thread, which stopped it
+
+    def start(self):
+        self._fill_queue() # so the first callbacks don't underrun
+        if not self.threaded:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _fill_queue(self):
+        while len(self._queue) < self.ahead_samples:
+            samples = self._callback(self.block_size)
+            with self._lock:
+                self._queue.write(samples)
+
+    def _run(self):
+        try:
+            while self._running:
+                # Cleared before filling, so a read() during _fill_queue() makes the wait() return straight away
+                # instead of being missed
+                self._wake.clear()
+                self._fill_queue()
+                self._wake.wait()
+        except Exception as error:
+            # The stream plays silence from here on (counted as underruns), say why rather than dying unnoticed
+            self.error = error
+            self._running = False
+            traceback.print_exc()
+
+    def read(self, num_frames):
+        '''Takes `num_frames` rendered frames, padded with silence if there aren't enough. Used as the stream callback'''
+        num_samples = num_frames * self.channels
+        if num_samples > len(self._out_buffer):
+            self._out_buffer = np.zeros(num_samples, dtype=np.int16)
+        out = self._out_buffer[:num_samples]
+        if not self.threaded:
+            self._fill_queue()
+
+        with self._lock:
+            available = min(num_samples, len(self._queue))
+            self._queue.read_into(out[:available])
+        if available < num_samples:
+            out[available:] = 0
+            self.underruns += 1
+
+        self._wake.set()
+        return out
+
+    @property
+    def queued_samples(self):
+        return len(self._queue)
+
+    @property
+    def latency_ms(self):
+        '''Latency added by the audio currently queued up'''
+        return len(self._queue) / self.channels / self.sample_rate * 1000
 
 class AudioDevice:
-    def __init__(self):
-        self._pyaudio = pyaudio.PyAudio()
+    def __init__(self, sample_rate=None, block_size=None, backend=None):
+        '''
+        sample_rate: of every stream opened, defaults to cfg.sample_rate. Engines played need the same
+          rate, e.g. engine_factory.create(name, sample_rate=device.sample_rate)
+        block_size: frames per device callback. Smaller is lower latency but gives the callback less
+          time per call, see the benchmark for the trade-off. None leaves it to the backend
+        backend: where the audio goes, see audio_backend. Defaults to the sound card (PyAudioBackend)
+        '''
+        self.backend = backend or audio_backend.PyAudioBackend()
+        self.sample_rate = sample_rate or cfg.sample_rate
+        self.block_size = block_size
+        self.producers = []
 
     def close(self):
-        self._pyaudio.terminate()
-
-    def play_stream(self, callback):
-        def callback_wrapped(in_data, frame_count, time_info, status_flags):
-            return (callback(frame_count), pyaudio.paContinue)
-
-        return self._pyaudio.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=cfg.sample_rate,
-            output=True,
-            stream_callback=callback_wrapped
-        )
+        for producer in self.producers:
+            producer.stop()
+        self.backend.terminate()
+
+    def play_stream(self, callback, ahead_ms=None, channels=1, stats=None):
+        '''
+        callback: function taking a number of frames and returning that many int16 samples per channel
+        ahead_ms: if set, `callback` is run by an AudioProducer (see self.producers) that keeps
+          this many milliseconds of audio rendered ahead of the stream
+        channels: 1 for mono, 2 for stereo, where `callback` returns interleaved samples (left, right, left, ...),
+          e.g. spatial.Spatialiser or Mixer(channels=2)
+        stats: stats.AudioStats to record callback times, PortAudio underflows and the producer's queue in.
+          Call stats.watch(engine) as well to track the engine's buffer and cycles
+
+        Returns the backend's stream, which has a close() method
+        '''
+        if ahead_ms is not None:
+            # Streams on a simulated clock get a producer that renders in step with it, see AudioProducer
+            producer = AudioProducer(callback, ahead_ms, self.block_size or 256, channels, self.sample_rate,
+                                     threaded=getattr(self.backend, 'realtime', True))
+            producer.start()
+            self.producers.append(producer)
+            callback = producer.read
+            if stats is not None:
+                stats.watch(producer=producer)
+
+        def callback_wrapped(frame_count, underflow, overflow):
+            if stats is None:
+                return callback(frame_count)
+            start = time.perf_counter()
+            samples = callback(frame_count)
+            stats.record_callback(time.perf_counter() - start, frame_count, underflow, overflow)
+            return samples
+
+        return self.backend.open_stream(callback_wrapped, channels, self.sample_rate, self.block_size)
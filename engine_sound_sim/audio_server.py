@@ -0,0 +1,256 @@
+'''
+Engine audio in its own process, so frame time spikes and input handling in the game can't starve the
+audio callback. The game talks to the audio process through a multiprocessing.shared_memory block:
+either RPM/throttle state for an Engine owned by the audio process, or rendered PCM samples.
+'''
+
+from engine_sound_sim import audio_backend
+from engine_sound_sim import engine_factory
+from engine_sound_sim import spatial
+from engine_sound_sim.audio_device import AudioDevice
+from engine_sound_sim.stats import AudioStats
+
+import math
+import time
+import numpy as np
+from multiprocessing import Process, shared_memory
+
+# Layout of the shared memory block: float64 state values, AudioStats counters, then (PCM mode only) the sample ring
+# _UNDERRUNS counts the PCM callback running out of samples, _PRODUCER_UNDERRUNS the AudioProducers' (ahead_ms)
+_RPM, _THROTTLE, _RUNNING, _UNDERRUNS, _PAN, _DOPPLER, _PRODUCER_UNDERRUNS = range(7)
+_STATE_BYTES = 7 * 8
+_STATS_OFFSET = _STATE_BYTES
+_RING_OFFSET = _STATS_OFFSET + AudioStats.nbytes
+_RING_CURSOR_BYTES = 2 * 8
+
+_POLL_INTERVAL = 0.02 # seconds between checks for shutdown in the audio process
+
+class _SharedRing:
+    '''
+    int16 sample ring in shared memory with one writing and one reading process.
+    Each cursor is only ever moved by one side, so no lock is needed.
+    '''
+    def __init__(self, buf, capacity):
+        self._cursors = np.ndarray((2,), dtype=np.int64, buffer=buf, offset=_RING_OFFSET) # samples written, read
+        self._samples = np.ndarray((capacity,), dtype=np.int16, buffer=buf, offset=_RING_OFFSET+_RING_CURSOR_BYTES)
+
+    def __len__(self):
+        return int(self._cursors[0] - self._cursors[1])
+
+    def write(self, samples):
+        '''Appends as many of `samples` as fit, returns how many were written'''
+        written, read = int(self._cursors[0]), int(self._cursors[1])
+        num_samples = min(len(samples), len(self._samples) - (written - read))
+        start = written % len(self._samples)
+        first = min(num_samples, len(self._samples) - start)
+        self._samples[start:start+first] = samples[:first]
+        self._samples[:num_samples-first] = samples[first:num_samples]
+        self._cursors[0] = written + num_samples # publish only once the samples are in place
+        return num_samples
+
+    def read_into(self, out):
+        '''Fills as much of `out` as possible, returns how many samples were read'''
+        written, read = int(self._cursors[0]), int(self._cursors[1])
+        num_samples = min(len(out), written - read)
+        start = read % len(self._samples)
+        first = min(num_samples, len(self._samples) - start)
+        out[:first] = self._samples[start:start+first]
+        out[first:num_samples] = self._samples[:num_samples-first]
+        self._cursors[1] = read + num_samples
+        return num_samples
+
+    def release(self):
+        # Views into the shared memory must be gone before it can be closed
+        self._cursors = None
+        self._samples = None
+
+def _block_size(pcm_buffer_size):
+    return _RING_OFFSET + (_RING_CURSOR_BYTES + 2 * pcm_buffer_size if pcm_buffer_size else 0)
+
+class AudioClient:
+    def __init__(self, shm_name, pcm_buffer_size=None):
+        '''
+        Game-side handle to an AudioServer. Only holds the name of the shared memory block,
+        so it can be passed to another process and attaches on first use.
+        '''
+        self.shm_name = shm_name
+        self.pcm_buffer_size = pcm_buffer_size
+        self._shm = None
+        self._state = None
+        self._stats = None
+        self._ring = None
+
+    def __getstate__(self):
+        return {'shm_name': self.shm_name, 'pcm_buffer_size': self.pcm_buffer_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _attach(self, shm=None):
+        if self._shm is None:
+            self._shm = shm or shared_memory.SharedMemory(name=self.shm_name)
+            self._state = np.ndarray((_STATE_BYTES // 8,), dtype=np.float64, buffer=self._shm.buf)
+            self._stats = AudioStats(self._shm.buf[_STATS_OFFSET:_RING_OFFSET])
+            if self.pcm_buffer_size:
+                self._ring = _SharedRing(self._shm.buf, self.pcm_buffer_size)
+        return self._state
+
+    def set_rpm(self, rpm):
+        '''Engine runs at exactly `rpm`'''
+        self._attach()[_RPM] = rpm
+
+    def set_throttle(self, fraction):
+        '''Engine revs itself up and down from throttle position (see Engine.throttle) instead of following set_rpm'''
+        state = self._attach()
+        state[_THROTTLE] = fraction
+        state[_RPM] = math.nan
+
+    def set_spatial(self, pan, doppler=1.0):
+        '''Stereo only: pans the engine (-1 left to 1 right) and shifts its pitch by `doppler`, see spatial.relative'''
+        state = self._attach()
+        state[_PAN] = pan
+        state[_DOPPLER] = doppler
+
+    def write_pcm(self, samples):
+        '''PCM mode only: queues int16 samples (interleaved, in stereo) for playback, returns how many fitted'''
+        assert self.pcm_buffer_size, 'AudioServer was not started in PCM mode'
+        self._attach()
+        return self._ring.write(samples)
+
+    @property
+    def queued_pcm(self):
+        self._attach()
+        return len(self._ring) if self._ring else 0
+
+    @property
+    def running(self):
+        return bool(self._attach()[_RUNNING])
+
+    @property
+    def underruns(self):
+        '''Times the audio callback was short of samples (PCM mode) or, with ahead_ms, of pre-rendered audio'''
+        state = self._attach()
+        return int(state[_UNDERRUNS] + state[_PRODUCER_UNDERRUNS])
+
+    @property
+    def stats(self):
+        '''stats.AudioStats of the audio process, live. .snapshot() or .export(path) to keep a copy'''
+        self._attach()
+        return self._stats
+
+    def close(self):
+        if self._shm is not None:
+            self._state = None
+            self._stats = None
+            if self._ring is not None:
+                self._ring.release()
+                self._ring = None
+            self._shm.close()
+            self._shm = None
+
+def _serve(client, engine_name, ahead_ms, channels, sample_rate, block_size, backend):
+    '''Body of the audio process: plays until the client clears the running flag'''
+    state = client._attach()
+    stats = client.stats
+    if engine_name:
+        engine = engine_factory.create(engine_name, sample_rate=sample_rate)
+        stats.watch(engine=engine)
+        if channels == 2:
+            spatialiser = spatial.Spatialiser(engine.gen_audio)
+        def callback(num_frames):
+            rpm = state[_RPM]
+            if math.isnan(rpm):
+                engine.throttle(state[_THROTTLE])
+            elif rpm:  # 0 until the game sets it, engine stays at idle
+                engine.specific_rpm(rpm)
+            if channels == 1:
+                return engine.gen_audio(num_frames)
+            spatialiser.set(pan=state[_PAN], doppler=state[_DOPPLER])
+            return spatialiser.gen_audio(num_frames)
+    else:
+        out_buffer = np.zeros(1024, dtype=np.int16)
+        def callback(num_frames):
+            nonlocal out_buffer
+            num_samples = num_frames * channels
+            if num_samples > len(out_buffer):
+                out_buffer = np.zeros(num_samples, dtype=np.int16)
+            out = out_buffer[:num_samples]
+            available = client._ring.read_into(out)
+            if available < num_samples:
+                out[available:] = 0
+                state[_UNDERRUNS] += 1
+            return out
+
+    audio_device = AudioDevice(sample_rate, block_size, audio_backend.create(backend))
+    stream = audio_device.play_stream(callback, ahead_ms, channels, stats)
+    try:
+        while state[_RUNNING]:
+            time.sleep(_POLL_INTERVAL)
+            if audio_device.producers:
+                state[_PRODUCER_UNDERRUNS] = sum(producer.underruns for producer in audio_device.producers)
+    finally:
+        stream.close()
+        audio_device.close()
+        del stream, audio_device, callback, state, stats # views into the shared memory have to go before closing it
+        client.close()
+
+class AudioServer:
+    def __init__(self, engine_name='formula_one', ahead_ms=None, pcm_buffer_size=None, channels=1,
+                 sample_rate=None, block_size=None, backend=None):
+        '''
+        engine_name: engine_factory preset the audio process builds its Engine from
+        ahead_ms: passed on to AudioDevice.play_stream, renders audio ahead on a producer thread
+        pcm_buffer_size: if set, no Engine is built and the audio process plays samples sent with
+          AudioClient.write_pcm, through a shared ring of this many samples
+        channels: 1, or 2 for stereo with the engine placed by AudioClient.set_spatial
+        sample_rate, block_size: of the audio device and engine, see AudioDevice
+        backend: audio_backend.create() name, e.g. 'null' on machines without a sound card, or a NullBackend
+        '''
+        assert channels in (1, 2), 'channels not 1 or 2'
+        self.engine_name = None if pcm_buffer_size else engine_name
+        self.ahead_ms = ahead_ms
+        self.pcm_buffer_size = pcm_buffer_size
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.backend = backend
+
+        self._shm = None
+        self._process = None
+        self._client = None
+
+    def start(self):
+        self._shm = shared_memory.SharedMemory(create=True, size=_block_size(self.pcm_buffer_size))
+        self._client = AudioClient(self._shm.name, self.pcm_buffer_size)
+        state = self._client._attach(self._shm)
+        state[:] = 0
+        state[_DOPPLER] = 1
+        if self.pcm_buffer_size:
+            self._client._ring._cursors[:] = 0
+        state[_RUNNING] = 1
+
+        args = (self.client(), self.engine_name, self.ahead_ms, self.channels, self.sample_rate, self.block_size,
+                self.backend)
+        self._process = Process(target=_serve, args=args, daemon=True)
+        self._process.start()
+        return self._client
+
+    def client(self):
+        '''A new AudioClient, e.g. for passing to the game process'''
+        return AudioClient(self._shm.name, self.pcm_buffer_size)
+
+    def stop(self, timeout=2):
+        '''Asks the audio process to close its stream and exit, then frees the shared memory'''
+        if self._process is None:
+            return
+
+        self._client._attach()[_RUNNING] = 0
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+
+        self._client.close()
+        self._shm.unlink()
+        self._shm = None
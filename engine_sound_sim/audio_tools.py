@@ -1,4 +1,5 @@
 from engine_sound_sim import cfg
+from engine_sound_sim import sound_bank
 
 import math
 import numpy as np
@@ -6,10 +7,21 @@ import numpy as np
 def concat(bufs):
     return np.hstack(bufs)
 
-def overlay(bufs):
+def overlay(bufs, out=None):
+    '''
+    Sums equal-length buffers and normalizes the result.
+    out: buffer to sum into (e.g. a reused float32 buffer) instead of copying every buffer into a new one
+    '''
     assert type(bufs) == list and len(bufs), 'bufs must be a non-empty list'
     assert all(len(bufs[0]) == len(buf) for buf in bufs), 'All buffers must have the same length'
 
+    if out is not None:
+        np.copyto(out, bufs[0], casting='same_kind')
+        for buf in bufs[1:]:
+            np.add(out, buf, out=out, casting='same_kind')
+        normalize_volume(out)
+        return out
+
     bufs = [np.copy(buf) for buf in bufs]
     for buf in bufs:
         #print(buf)
@@ -29,28 +41,52 @@ def pad_with_zeros(buf, num_zeros):
         np.zeros(num_zeros)
     ])
 
-def normalize_volume(buf, loudest_sample=None):
-    '''Makes the loudest sample in the buffer use the max_16bit volume. No clipping'''
-    buf *= np.int32((cfg.max_16bit / (loudest_sample or find_loudest_sample(buf))) or 750)
-
-def exponential_volume_dropoff(buf, duration, base):
-    num_samples = math.ceil(duration * cfg.sample_rate)
-    zeros_required = len(buf) - num_samples
+def normalize_volume(buf, loudest_sample=None, out=None):
+    '''
+    Makes the loudest sample in the buffer use the max_16bit volume. No clipping
+    out: where to write the result, defaults to `buf` itself
+    '''
+    factor = np.int32((cfg.max_16bit / (loudest_sample or find_loudest_sample(buf))) or 750)
+    if buf.dtype.kind == 'f':
+        factor = buf.dtype.type(factor) # an int32 would promote float32 buffers to float64
+    if out is None:
+        buf *= factor
+        return buf
+    return np.multiply(buf, factor, out=out, casting='same_kind')
 
-    unpadded_curve = base / np.logspace(1, 10, num=num_samples, base=base)
-    dropoff_curve = pad_with_zeros(unpadded_curve, zeros_required)
+def exponential_volume_dropoff(buf, duration, base, out=None, sample_rate=None):
+    '''
+    Fades `buf` out exponentially over `duration` seconds, silent after that
+    out: where to write the result, defaults to `buf` itself
+    sample_rate: of `buf`, defaults to cfg.sample_rate
+    '''
+    dropoff_curve = sound_bank.dropoff_envelope(duration, base, sample_rate)
+    num_samples = len(dropoff_curve)
+    assert num_samples <= len(buf), 'buf is shorter than the dropoff duration'
+    if out is None:
+        out = buf
 
-    buf *= dropoff_curve
+    np.multiply(buf[:num_samples], dropoff_curve, out=out[:num_samples], casting='same_kind')
+    out[num_samples:] = 0
+    return out
 
 def find_loudest_sample(buf):
-    return np.max(np.abs(buf))
+    # max of the two ends rather than np.abs(buf), which would copy the whole buffer
+    return max(np.max(buf), -np.min(buf))
 
-def slice(buf, duration):
+def slice(buf, duration, sample_rate=None):
     '''Take slice of audio buffers based on the duration of sound required'''
     if duration <= 0:
         return []
-    num_samples = math.ceil(duration * cfg.sample_rate)
+    num_samples = math.ceil(duration * (sample_rate or cfg.sample_rate))
     return buf[:num_samples]
 
-def in_playback_format(buf):
-    return buf.astype(np.int16)
+def in_playback_format(buf, out=None):
+    '''
+    int16 copy of `buf` for the audio device
+    out: int16 buffer to write to (e.g. a reused one) instead of allocating a new one
+    '''
+    if out is None:
+        return buf.astype(np.int16)
+    np.copyto(out, buf, casting='unsafe')
+    return out
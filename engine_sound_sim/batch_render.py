@@ -0,0 +1,85 @@
+'''
+Renders many engine_factory presets over an RPM sweep in parallel, one process per preset at a time.
+Writes one audio file per preset and a summary.json with render time and realtime factor for each.
+
+Usage: python -m engine_sound_sim.batch_render <out dir> [presets ...] [--rpm START END] [--seconds N] [--workers N]
+                                               [--sample-rate HZ]
+'''
+
+from engine_sound_sim import engine_factory
+from engine_sound_sim import render
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+def _render_preset(name, path, rpm, seconds, sample_rate):
+    engine = engine_factory.create(name, sample_rate=sample_rate)
+    start_rpm, end_rpm = rpm or (engine.idle_rpm, engine.limiter_rpm)
+    stats = render.render(engine, *render.rpm_sweep(start_rpm, end_rpm, seconds), path)
+    stats.update(preset=name, path=path, start_rpm=start_rpm, end_rpm=end_rpm)
+    return stats
+
+def render_presets(out_dir, names=None, rpm=None, seconds=10, file_type='wav', workers=None, sample_rate=None):
+    '''
+    Renders each preset in `names` (default: all of them) to <out_dir>/<name>.<file_type>,
+    sweeping from rpm[0] to rpm[1] (default: each engine's idle to limiter) over `seconds`.
+    workers: processes to render with, defaults to one per CPU
+    sample_rate: of the rendered audio, defaults to cfg.sample_rate
+
+    Returns the summary that's also written to <out_dir>/summary.json
+    '''
+    names = names or engine_factory.names()
+    unknown = set(names) - set(engine_factory.names())
+    if unknown:
+        raise ValueError(f'Unknown presets: {", ".join(sorted(unknown))}')
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    presets = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_render_preset, name, os.path.join(out_dir, f'{name}.{file_type}'), rpm, seconds,
+                        sample_rate)
+            for name in names
+        ]
+        for future in as_completed(futures):
+            stats = future.result()
+            presets[stats['preset']] = stats
+    wall_time = time.perf_counter() - start
+
+    total_duration = sum(stats['duration'] for stats in presets.values())
+    summary = {
+        'wall_time': wall_time,
+        'workers': workers or os.cpu_count(),
+        'total_duration': total_duration,
+        'realtime_factor': total_duration / wall_time,
+        'presets': [presets[name] for name in names],
+    }
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Render engine_factory presets sweeping through RPM, in parallel')
+    parser.add_argument('out_dir', help='directory to write the audio files and summary.json to')
+    parser.add_argument('presets', nargs='*', help='presets to render (default: all)')
+    parser.add_argument('--rpm', nargs=2, type=float, metavar=('START', 'END'),
+                        help='RPM at the start and end (default: idle to limiter of each engine)')
+    parser.add_argument('--seconds', type=float, default=10, help='length of each sweep')
+    parser.add_argument('--type', dest='file_type', choices=('wav', 'npy'), default='wav')
+    parser.add_argument('--workers', type=int, help='processes to use (default: one per CPU)')
+    parser.add_argument('--sample-rate', type=int, help='Hz (default: cfg.sample_rate)')
+    args = parser.parse_args()
+
+    summary = render_presets(args.out_dir, args.presets, args.rpm, args.seconds, args.file_type, args.workers,
+                             args.sample_rate)
+    for stats in summary['presets']:
+        print(f"{stats['preset']:<36} {stats['render_time']:7.2f}s {stats['realtime_factor']:7.0f}x realtime")
+    print(f"{len(summary['presets'])} presets, {summary['total_duration']:.0f}s of audio in {summary['wall_time']:.2f}s "
+          f"on {summary['workers']} workers ({summary['realtime_factor']:.0f}x realtime)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+'''
+Benchmark of Engine.gen_audio against its real-time budget: a block of N samples has to be
+rendered in under N / sample_rate seconds (23ms for 1024 samples at 44.1kHz).
+Every preset is run at idle, mid-range and limiter RPM with typical PortAudio block sizes, and optionally
+at several sample rates, ending with the CPU/latency trade-off of each sample rate and block size.
+
+Usage: python -m engine_sound_sim.benchmark [presets ...] [--blocks 256 1024] [--rates 22050 48000] [--calls N]
+                                            [--mode cycle|continuous|harmonic] [--json results.json]
+'''
+
+from engine_sound_sim import cfg
+from engine_sound_sim import engine_factory
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+BLOCK_SIZES = (256, 512, 1024, 2048)
+
+def rpm_points(engine):
+    return {
+        'idle': engine.idle_rpm,
+        'mid': (engine.idle_rpm + engine.limiter_rpm) / 2,
+        'limiter': engine.limiter_rpm,
+    }
+
+def _make_engine(name, rpm_point, block_size, warmup, sample_rate, mode):
+    engine = engine_factory.create(name, sample_rate=sample_rate, mode=mode)
+    engine.specific_rpm(rpm_points(engine)[rpm_point])
+    for _ in range(warmup): # let buffers grow to size before measuring
+        engine.gen_audio(block_size)
+    return engine
+
+def bench_case(name, rpm_point, block_size, calls=500, warmup=20, sample_rate=None, mode=None):
+    '''Times `calls` calls of gen_audio(block_size) for preset `name` held at one of its rpm_points'''
+    engine = _make_engine(name, rpm_point, block_size, warmup, sample_rate, mode)
+    times = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        engine.gen_audio(block_size)
+        times[i] = time.perf_counter() - start
+
+    # Memory allocated on the way through a call, measured separately as tracing slows everything down
+    engine = _make_engine(name, rpm_point, block_size, warmup, sample_rate, mode)
+    tracemalloc.start()
+    alloc_bytes = 0
+    for _ in range(min(calls, 50)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        engine.gen_audio(block_size)
+        alloc_bytes += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    budget = block_size / engine.sample_rate
+    p50, p99 = np.percentile(times, [50, 99])
+    return {
+        'preset': name,
+        'rpm_point': rpm_point,
+        'rpm': rpm_points(engine)[rpm_point],
+        'mode': engine.mode,
+        'sample_rate': engine.sample_rate,
+        'block_size': block_size,
+        'calls': calls,
+        'budget_ms': budget * 1000,
+        'mean_ms': times.mean() * 1000,
+        'p50_ms': p50 * 1000,
+        'p99_ms': p99 * 1000,
+        'max_ms': times.max() * 1000,
+        'realtime_factor': budget / times.mean(), # how many times faster than the budget on average
+        'alloc_bytes_per_call': alloc_bytes / min(calls, 50), # peak extra memory while rendering a block
+    }
+
+def tradeoff(results):
+    '''
+    For each sample rate and block size: the latency a block adds, and how much of its time budget
+    rendering took, on average and in the worst case (p99 of the slowest preset and RPM). A worst-case
+    load near or above 1 means glitches on this machine.
+    '''
+    settings = sorted({(r['sample_rate'], r['block_size']) for r in results})
+    summary = []
+    for sample_rate, block_size in settings:
+        cases = [r for r in results if (r['sample_rate'], r['block_size']) == (sample_rate, block_size)]
+        summary.append({
+            'sample_rate': sample_rate,
+            'block_size': block_size,
+            'latency_ms': block_size / sample_rate * 1000,
+            'mean_load': np.mean([r['mean_ms'] / r['budget_ms'] for r in cases]),
+            'worst_p99_load': max(r['p99_ms'] / r['budget_ms'] for r in cases),
+        })
+    return summary
+
+def run(names=None, block_sizes=BLOCK_SIZES, calls=500, sample_rates=None, mode=None):
+    '''
+    Benchmarks every combination of preset, RPM point, sample rate (default: cfg.sample_rate only) and
+    block size, returns the results and their tradeoff() as a dict. `mode` overrides every preset's Engine mode
+    '''
+    results = [
+        bench_case(name, rpm_point, block_size, calls, sample_rate=sample_rate, mode=mode)
+        for name in names or engine_factory.names()
+        for rpm_point in ('idle', 'mid', 'limiter')
+        for sample_rate in sample_rates or (cfg.sample_rate,)
+        for block_size in block_sizes
+    ]
+    return {
+        'sample_rates': list(sample_rates or (cfg.sample_rate,)),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+        'tradeoff': tradeoff(results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark engine audio synthesis against the real-time budget')
+    parser.add_argument('presets', nargs='*', help='presets to benchmark (default: all)')
+    parser.add_argument('--blocks', nargs='+', type=int, default=BLOCK_SIZES, help='block sizes in samples')
+    parser.add_argument('--rates', nargs='+', type=int, help='sample rates in Hz (default: cfg.sample_rate)')
+    parser.add_argument('--mode', choices=('cycle', 'continuous', 'harmonic'), help='Engine mode (default: each preset\'s)')
+    parser.add_argument('--calls', type=int, default=500, help='timed calls per case')
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON to PATH ('-' for stdout)")
+    args = parser.parse_args()
+
+    report = run(args.presets, args.blocks, args.calls, args.rates, args.mode)
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        return
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{'preset':<36} {'rpm':>7} {'rate':>6} {'block':>5} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'budget':>7} "
+          f"{'x realtime':>10} {'alloc kB':>8}")
+    for r in report['results']:
+        print(f"{r['preset']:<36} {r['rpm']:7.0f} {r['sample_rate']:6} {r['block_size']:5} {r['p50_ms']:7.3f} "
+              f"{r['p99_ms']:7.3f} {r['max_ms']:7.3f} {r['budget_ms']:7.2f} {r['realtime_factor']:10.1f} "
+              f"{r['alloc_bytes_per_call']/1000:8.1f}")
+
+    print(f"\n{'rate':>6} {'block':>5} {'latency ms':>10} {'mean load':>9} {'worst p99 load':>14}")
+    for t in report['tradeoff']:
+        print(f"{t['sample_rate']:6} {t['block_size']:5} {t['latency_ms']:10.2f} {t['mean_load']:9.1%} "
+              f"{t['worst_p99_load']:14.1%}")
+
+if __name__ == '__main__':
+    main()
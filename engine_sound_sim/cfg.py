@@ -1,5 +1,2 @@
 sample_rate = 44100
 max_16bit = 2**(16-1)-1  # 32,767
-
-# added by omar
-sound_merge_method = "average"  # max or average
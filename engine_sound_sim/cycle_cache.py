@@ -0,0 +1,81 @@
+'''Cache of rendered engine cycles, so RPMs that keep coming back don't have to be resynthesised'''
+
+from collections import OrderedDict
+
+class CycleCache:
+    def __init__(self, bucket_rpm=25, max_bytes=8 * 2**20):
+        '''
+        Least-recently-used store of rendered engine cycles (int16 buffers).
+
+        bucket_rpm: RPMs are rounded to the nearest multiple of this, every RPM in a bucket shares one cycle
+        max_bytes: memory cap for all stored cycles, least recently used cycles are evicted to stay under it
+        '''
+        assert bucket_rpm > 0, 'bucket_rpm <= 0'
+        assert max_bytes > 0, 'max_bytes <= 0'
+        self.bucket_rpm = bucket_rpm
+        self.max_bytes = max_bytes
+
+        self._cycles = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._cycles)
+
+    def bucket(self, rpm):
+        '''Key of the bucket `rpm` falls in'''
+        return round(rpm / self.bucket_rpm)
+
+    def bucket_rpm_of(self, key):
+        '''RPM that cycles in bucket `key` are rendered at'''
+        return key * self.bucket_rpm
+
+    def get(self, key):
+        '''Returns the cycle stored for `key` (read-only) or None, and counts the hit or miss'''
+        cycle = self._cycles.get(key)
+        if cycle is None:
+            self.misses += 1
+            return None
+
+        self._cycles.move_to_end(key)
+        self.hits += 1
+        return cycle
+
+    def put(self, key, cycle):
+        '''Stores `cycle` for `key`, evicting the least recently used cycles if over the memory cap'''
+        if cycle.nbytes > self.max_bytes:
+            return # would evict everything and still not fit
+
+        if key in self._cycles:
+            self.nbytes -= self._cycles.pop(key).nbytes
+
+        cycle.setflags(write=False) # shared between callers, so nobody gets to change it
+        self._cycles[key] = cycle
+        self.nbytes += cycle.nbytes
+
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._cycles.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self._cycles.clear()
+        self.nbytes = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+            'cycles': len(self),
+            'nbytes': self.nbytes,
+        }
@@ -1,7 +1,11 @@
 '''Basic simulation of engine for purposes of audio generation'''
 from engine_sound_sim import cfg
 from engine_sound_sim import audio_tools
+from engine_sound_sim.cycle_cache import CycleCache
+from engine_sound_sim.ring_buffer import RingBuffer
+from engine_sound_sim import sound_bank
 
+import bisect
 import math
 import numpy as np
 
@@ -15,8 +19,15 @@ def _convert_timing_format(timing):
     for i in range(1, len(timing)):
         timing[i] += timing[i-1]
 
+def _num_samples(durations, max_samples, sample_rate):
+    '''Vectorised len(audio_tools.slice(buf, duration, sample_rate)) for a buffer of `max_samples` samples'''
+    num_samples = np.ceil(durations * sample_rate)
+    num_samples[durations <= 0] = 0
+    return np.minimum(num_samples, max_samples).astype(np.intp)
+
 class Engine:
-    def __init__(self, idle_rpm, limiter_rpm, strokes, cylinders, timing, fire_snd, between_fire_snd, unequal=[]):
+    def __init__(self, idle_rpm, limiter_rpm, strokes, cylinders, timing, fire_snd, between_fire_snd, unequal=[],
+                 audio_buffer_size=2**15, mode='cycle', dtype=np.float64, sample_rate=None, harmonics=64):
         '''
         Note: all sounds used will be concatenated to suit engine run speed.
         Make sure there's excess audio data available in the buffer.
@@ -29,11 +40,31 @@ class Engine:
           to fire after the previous cylinder fires. See engine_factory.py for examples
         fire_snd: sound engine should make when a cylinder fires
         between_fire_snd: sound engine should make between cylinders firing
+        unequal: extra delay in milliseconds for each cylinder to fire late by, e.g. for unequal length headers.
+          Sound delayed past the end of the engine cycle is played at the start of the next one
+        audio_buffer_size: samples of rendered audio that can be buffered, grows if an engine cycle doesn't fit
+        mode: how audio is rendered
+          'cycle': one whole engine cycle at a time, each at a single RPM and normalised on its own
+          'continuous': exactly the samples asked for, with RPM ramped across them and the crank angle
+            carried between calls, so RPM changes don't click. Needs a silent between_fire_snd
+          'harmonic': like 'continuous', but played as a bank of `harmonics` sine waves at multiples of
+            the engine cycle frequency, with amplitudes worked out from the firing order and fire_snd.
+            Costs the same at any RPM and whatever the number of cylinders, but for most presets more per
+            block than 'cycle', several times more at idle. Building the first engine of a spec takes a few
+            tens of ms. Needs a silent between_fire_snd
+        dtype: sample type cycles are mixed in. np.float32 halves the memory used and moved per cycle
+        sample_rate: rate the sounds are at and gen_audio renders at, defaults to cfg.sample_rate.
+          engine_factory.create(..., sample_rate=...) resamples the preset sounds to match
+        harmonics: number of harmonics played in 'harmonic' mode
         '''
         # Audio library will request a specific number of samples, but we can't simulate partial engine
         # revolutions, so we buffer whatever we have left over. We start with some zero samples to stop
-        # the pop as the audio device opens.
-        self._audio_buffer = np.zeros([256])
+        # the pop as the audio device opens. Samples go through a fixed-size ring buffer and out through a
+        # reused output buffer, so nothing is allocated per call unless a request is bigger than any before.
+        self._audio_buffer = RingBuffer(audio_buffer_size)
+        self._audio_buffer.write(np.zeros(256, dtype=np.int16))
+        self._out_buffer = np.zeros(1024, dtype=np.int16)
+        self.sample_rate = sample_rate or cfg.sample_rate
 
         self._rpm = idle_rpm
         self.idle_rpm = idle_rpm
@@ -52,8 +83,8 @@ class Engine:
         assert type(fire_snd) == np.ndarray and \
                type(between_fire_snd) == np.ndarray, \
             'Sounds should be passed in as numpy.ndarray buffers'
-        assert len(fire_snd) >= cfg.sample_rate * 1 and \
-               len(between_fire_snd) >= cfg.sample_rate * 1, \
+        assert len(fire_snd) >= self.sample_rate * 1 and \
+               len(between_fire_snd) >= self.sample_rate * 1, \
             'Ensure all audio buffers contain at least 1 second of data, see docstring'
         self.fire_snd = fire_snd
         self.between_fire_snd = between_fire_snd
@@ -63,10 +94,46 @@ class Engine:
             unequal = [0]*cylinders
         self.unequal = unequal
 
-        self.unequalmore = []
-        self.previousms = 0
+        # Per-cylinder values that don't change between cycles, kept as arrays for the cycle renderer
+        self._timing_strokes = np.asarray(self.timing, dtype=np.float64) / 180
+        unequal = np.asarray(self.unequal, dtype=np.float64)
+        self._unequal_sec = np.where(unequal > 0, unequal / 1000, 0)  # unequal converted from milliseconds to seconds
+        self._equal_cylinders = self._unequal_sec == 0
+        self._has_unequal = not np.all(self._equal_cylinders)
+        self._between_is_silent = not np.any(self.between_fire_snd)
+
+        # Cycles are mixed in reused `dtype` buffers and converted into a reused int16 buffer
+        self.dtype = np.dtype(dtype)
+        self._fire_snd_work = sound_bank.prepared(self.fire_snd, self.dtype) # shared by engines with the same sound
+        self._mix = np.zeros(0, dtype=self.dtype)
+        self._carry = np.zeros(0, dtype=self.dtype) # sound of unequal cylinders spilling into the next cycle
+        self._num_carry = 0
+        self._cycle_buffer = np.zeros(0, dtype=np.int16)
+
+        # Rendered cycles keyed by RPM, off unless enable_cycle_cache() is called
+        self.cycle_cache = None
+        self.cycles_rendered = 0 # engine cycles played so far, for stats.AudioStats
+
+        assert mode in ('cycle', 'continuous', 'harmonic'), \
+            'mode not in (\'cycle\', \'continuous\', \'harmonic\'), see docstring'
+        self.mode = mode
+        if mode == 'continuous':
+            assert self._between_is_silent, 'continuous mode only plays fire_snd, between_fire_snd must be silence'
+            self._init_continuous()
+        elif mode == 'harmonic':
+            assert self._between_is_silent, 'harmonic mode only plays fire_snd, between_fire_snd must be silence'
+            self._init_harmonic(harmonics)
+
+    def _mix_buffer(self, num_samples):
+        '''Zeroed mix buffer of `num_samples` samples, reused between cycles'''
+        if num_samples > len(self._mix):
+            self._mix = np.zeros(num_samples, dtype=self.dtype)
+        buf = self._mix[:num_samples]
+        buf.fill(0)
+        return buf
 
     def _gen_audio_one_engine_cycle(self):
+        '''One engine cycle in int16, in a buffer that's reused by the next call'''
         # Calculate durations of fire and between fire events
         strokes_per_min = self._rpm * 2 # revolution of crankshaft is 2 strokes
         strokes_per_sec = strokes_per_min / 60
@@ -74,140 +141,329 @@ class Engine:
         fire_duration = sec_between_fires / self.strokes # when exhaust valve is open
         between_fire_duration = sec_between_fires / self.strokes * (self.strokes-1) # when exhaust valve is closed
 
-        # Generate audio buffers for all of the cylinders individually
-        bufs = []
-        bufsunequal = []
-        fire_snd = audio_tools.slice(self.fire_snd, fire_duration)
-        for cylinder in range(0, self.cylinders):
-            unequalms = (
-                self.unequal[cylinder]/1000  # unequal converted from milliseconds to seconds
-                if self.unequal[cylinder] > 0  # if unequal set
-                #else self.unequal[cylinder]  # else 0
-                else 0
-            )
-            #unequalms = min(unequalms, (self.timing[cylinder] / 180) * 2 / strokes_per_sec)
-            before_fire_duration = (self.timing[cylinder] / 180) / strokes_per_sec# + unequalms # 180 degrees crankshaft rotation per stroke
-            before_fire_snd = audio_tools.slice(self.between_fire_snd, before_fire_duration+unequalms)
-            after_fire_duration = between_fire_duration - before_fire_duration # - unequalms
-            after_fire_snd = audio_tools.slice(self.between_fire_snd, after_fire_duration)
-            #print(len(audio_tools.concat([before_fire_snd, fire_snd, after_fire_snd])))
-            if len(self.unequalmore):
-                bufsunequal.append(np.array(self.unequalmore))
-            if unequalms:  # if unequal parameter set for cylinder
-                #print("unequal")
-                bufs.append(  # add to buffer
-                    np.array(  # make array
-                        [0]*len(  # a tring of 0s the length of
-                            audio_tools.concat(
-                                [
-                                    audio_tools.slice(
-                                        self.between_fire_snd,
-                                        before_fire_duration
-                                    ),  # silence as long as before_fire_duration (in seconds)
-                                    fire_snd,
-                                    after_fire_snd
-                                ]  # complete combustion sound including before and after
-                            )
-                        )
-                    )
-                )
-                #if self.previousms != unequalms:  # unequal ms different from previous cylinder
-                before_fire_snd = audio_tools.slice(
-                    self.between_fire_snd, # silence
-                    before_fire_duration + unequalms# - self.previousms  # current duration plus difference between unequals
-                )  # make interval before sound smaller
-                bufsunequal.append(
-                    audio_tools.concat(
-                        [before_fire_snd, fire_snd, after_fire_snd]  # combustion + silence
-                    )
-                )  # add generated combustion to unequal buffer
-                self.previousms = unequalms  # make current unequalms the new previousms
-            else:
-                #forgot what this was for, probly before separate buffers
-                """if self.unequaldelay > len(audio_tools.concat([before_fire_snd, fire_snd, after_fire_snd])):
-
-                    self.unequaldelay -= len(audio_tools.concat([before_fire_snd, fire_snd, after_fire_snd]))
-                else:
-                    bufsunequal.append(
-                        np.array(  # make numpy array of
-                            [0]*(  # a list of 0s with the amount of 0s equal to
-                                len(  # the length of
-                                    audio_tools.slice(self.between_fire_snd, self.unequaldelay)  # silence as long as unequal offset
-                                ) 
-                                - 
-                                len(
-                                    audio_tools.concat([before_fire_snd, fire_snd, after_fire_snd])
-                                )
-                            )
-                        )
-                    )"""
-                bufsunequal.append(
-                    np.array(
-                        [0]*len(
-                            audio_tools.concat(
-                                [before_fire_snd, fire_snd, after_fire_snd]  # combustion + silence
-                            )
-                        )
-                    )
-                )  # add silence to unequal buffer
-                bufs.append(
-                    audio_tools.concat(
-                        [before_fire_snd, fire_snd, after_fire_snd]  # combustion + silence
-                    )
-                )  # add combustion package to equal buffer
-
-        # combine both lists
-        #print(len(bufs))
-        #print("nextone")
-        #print(len(bufsunequal))
-        #bufs = list(np.maximum(bufs, bufsunequal))
-        # Make sure all buffers are the same length (may be off by 1 because of rounding issues)
-        
-        max_buf_len = len(max(bufs, key=len))
-        bufs = [audio_tools.pad_with_zeros(buf, max_buf_len-len(buf)) for buf in bufs]
-        
-        # same thing as before but with unequal buffer
-
-        max_buf_len_unequal = len(max(bufsunequal, key=len))
-        #print(max_buf_len)
-        #might not be good idea with unequal, since that's how the unequalness is made
-        bufsunequal = [audio_tools.pad_with_zeros(buf, max_buf_len_unequal-len(buf)) for buf in bufsunequal]
-
-        # Combine all the cylinder sounds
-        engine_snd = audio_tools.overlay(bufs)  # not sure
-        engine_snd_unequal = audio_tools.overlay(bufsunequal)  # not sure
-        #print(len(engine_snd), len(engine_snd_unequal))
-        if sum(engine_snd_unequal) > 0:  # if unequal buffer contains anything
-            if cfg.sound_merge_method == "average":  # average of both buffers
-                engine_snd = np.mean([engine_snd, engine_snd_unequal[:len(engine_snd)]], axis=0)
-            elif cfg.sound_merge_method == "max":  # maximum values of both buffers
-                engine_snd = np.maximum(engine_snd, engine_snd_unequal[:len(engine_snd)])
-        if len(engine_snd_unequal) > len(engine_snd):  # if unequal buffer is longer than 
-            self.unequalmore = engine_snd_unequal[len(engine_snd):]
-        return audio_tools.in_playback_format(engine_snd)
+        # Work out where every cylinder's sound lands in the cycle, in samples
+        fire_snd = audio_tools.slice(self._fire_snd_work, fire_duration, self.sample_rate)
+        num_fire = len(fire_snd)
+        max_between = len(self.between_fire_snd)
+        before_fire_duration = self._timing_strokes / strokes_per_sec # 180 degrees crankshaft rotation per stroke
+        num_before = _num_samples(before_fire_duration, max_between, self.sample_rate)
+        num_before_unequal = _num_samples(before_fire_duration + self._unequal_sec, max_between, self.sample_rate)
+        num_after = _num_samples(between_fire_duration - before_fire_duration, max_between, self.sample_rate)
+
+        # Every cylinder goes into one buffer, unequal ones delayed by their offset. The cycle is as long as
+        # with equal firing, sound that runs past its end is carried over into the start of the next one.
+        num_cycle = np.max(num_before + num_fire + num_after)
+        num_snd = max(num_cycle, np.max(num_before_unequal + num_fire + num_after), self._num_carry)
+        engine_snd = self._mix_buffer(num_snd)
+        engine_snd[:self._num_carry] += self._carry[:self._num_carry]
+        self._scatter_cylinders(engine_snd, fire_snd, num_before_unequal, num_after)
+        self._keep_carry(engine_snd[num_cycle:])
+
+        engine_snd = engine_snd[:num_cycle]
+        audio_tools.normalize_volume(engine_snd)
+        return self._in_playback_format(engine_snd)
+
+    def _keep_carry(self, spill):
+        '''Keeps `spill` (unnormalised) to add into the next cycle, in a buffer reused between cycles'''
+        if len(spill) > len(self._carry):
+            self._carry = np.zeros(len(spill), dtype=self.dtype)
+        self._carry[:len(spill)] = spill
+        self._num_carry = len(spill)
+
+    def _in_playback_format(self, engine_snd):
+        if len(engine_snd) > len(self._cycle_buffer):
+            self._cycle_buffer = np.zeros(len(engine_snd), dtype=np.int16)
+        return audio_tools.in_playback_format(engine_snd, out=self._cycle_buffer[:len(engine_snd)])
+
+    def _init_continuous(self):
+        # Crank angle (degrees into the engine cycle) and RPM at the end of the last rendered block
+        self._cycle_deg = 180 * self.strokes
+        self._crank_deg = 0.0
+        self._last_rpm = abs(self._rpm)
+        fire_deg = np.asarray(self.timing, dtype=np.float64) % self._cycle_deg
+        unequal_samples = np.ceil(self._unequal_sec * self.sample_rate).astype(int)
+        # (crank angle, delay in samples) of every fire in crank angle order, and the next one to come:
+        # the first after crank angle 0, at _next_fire_deg
+        self._fire_angles = sorted(zip(fire_deg.tolist(), unequal_samples.tolist()), key=lambda fire: fire[0])
+        self._next_fire = bisect.bisect_right([angle for angle, _ in self._fire_angles], self._crank_deg)
+        if self._next_fire == len(self._fire_angles):
+            self._next_fire = 0
+            self._next_fire_deg = self._fire_angles[0][0] + self._cycle_deg
+        else:
+            self._next_fire_deg = self._fire_angles[self._next_fire][0]
+
+        # Fire sounds still playing from previous blocks, as (start relative to the next block, length)
+        self._pending_fires = []
+
+        # Each fire sound lasts one stroke (180 degrees). Scale by the most that can overlap at a steady RPM,
+        # so the volume is fixed instead of renormalised every cycle. Up to that many fire sounds can be summed
+        # in int16 without overflowing. More can overlap with unequal delays or while the RPM is falling,
+        # those blocks are summed in int32 and clipped.
+        self._overlap = max(np.sum((fire_deg - angle) % self._cycle_deg < 180) for angle in fire_deg)
+        self._fire_snd_continuous = sound_bank.prepared(
+            self.fire_snd, np.int16, cfg.max_16bit / (audio_tools.find_loudest_sample(self.fire_snd) * self._overlap))
+        self._mix32 = np.zeros(0, dtype=np.int32)
+
+    def _gen_audio_continuous(self, out):
+        '''Fills `out` with engine sound, RPM ramped from the end of the last call to the current RPM'''
+        num_samples = len(out)
+        sample_rate = self.sample_rate
+        max_fire = len(self._fire_snd_continuous)
+
+        # RPM after sample i (1-based) is rpm + rpm_step*i, so the crank angle after n samples is
+        # crank_deg + deg_per_rpm * (rpm*n + rpm_step*n*(n+1)/2). Solving that for n finds each fire
+        # without working anything out per sample.
+        rpm = self._last_rpm
+        rpm_step = (abs(self._rpm) - rpm) / num_samples
+        deg_per_rpm = 6 / sample_rate # rpm * 360 degrees / 60 seconds, per sample
+        quad = deg_per_rpm * rpm_step / 2
+        lin = deg_per_rpm * (rpm + rpm_step / 2)
+        crank_end = self._crank_deg + quad * num_samples**2 + lin * num_samples
+
+        # Walk through the fires in crank angle order, only as far as the ones in this block
+        fires = self._pending_fires
+        fire_angles = self._fire_angles
+        fire = self._next_fire
+        angle = self._next_fire_deg
+        cycle_start = angle - fire_angles[fire][0] # crank angle the fire's cycle started at
+        while angle <= crank_end:
+            to_go = angle - self._crank_deg
+            n = 2 * to_go / (lin + math.sqrt(max(lin**2 + 4 * quad * to_go, 0)))
+            pos = min(max(math.ceil(n) - 1, 0), num_samples - 1)
+            length = min(math.ceil(sample_rate * 30 / (rpm + rpm_step * (pos + 1))), max_fire) # 1 stroke
+            fires.append((pos + fire_angles[fire][1], length))
+            fire += 1
+            if fire == len(fire_angles):
+                fire = 0
+                cycle_start += self._cycle_deg
+            angle = cycle_start + fire_angles[fire][0]
+
+        # Add the part of every fire sound that falls in this block, the rest carries over into the next
+        mix = out
+        if len(fires) > self._overlap and self._max_overlap(fires, num_samples) > self._overlap:
+            if num_samples > len(self._mix32):
+                self._mix32 = np.zeros(num_samples, dtype=np.int32)
+            mix = self._mix32[:num_samples]
+        mix.fill(0)
+        self._pending_fires = []
+        for start, length in fires:
+            end = start + length
+            if start < num_samples:
+                first = max(start, 0)
+                last = min(end, num_samples)
+                mix[first:last] += self._fire_snd_continuous[first-start:last-start]
+            if end > num_samples:
+                self._pending_fires.append((start - num_samples, length))
+        if mix is not out:
+            np.clip(mix, -cfg.max_16bit, cfg.max_16bit, out=mix)
+            np.copyto(out, mix, casting='unsafe')
+
+        cycles = crank_end // self._cycle_deg
+        self.cycles_rendered += int(cycles)
+        self._crank_deg = crank_end % self._cycle_deg
+        self._next_fire = fire
+        self._next_fire_deg = angle - cycles * self._cycle_deg
+        self._last_rpm = abs(self._rpm)
+        return out
+
+    @staticmethod
+    def _max_overlap(fires, num_samples):
+        '''Most of the (start, length) fire sounds playing at once within the first num_samples samples'''
+        starts = sorted(max(start, 0) for start, length in fires if start < num_samples)
+        ends = sorted(start + length for start, length in fires if start < num_samples)
+        most = playing = end = 0
+        for start in starts:
+            playing += 1
+            while ends[end] <= start:
+                playing -= 1
+                end += 1
+            most = max(most, playing)
+        return most
+
+    def _init_harmonic(self, harmonics):
+        # Phase of the engine cycle (0 to 1) and RPM at the end of the last rendered block
+        self._cycle_phase = 0.0
+        self._last_rpm = abs(self._rpm)
+        self._harmonic_ramp = np.zeros(0)
+
+        # Spectrum of the firing order: each cylinder's firing is a delay, the same for every RPM
+        # unless cylinders have an unequal delay in milliseconds on top
+        harmonic_numbers = np.arange(1, harmonics + 1, dtype=np.float64)
+        fire_cycles = np.asarray(self.timing, dtype=np.float64) / (180 * self.strokes)
+        firing_order = np.exp(-2j * np.pi * np.outer(harmonic_numbers, fire_cycles[self._equal_cylinders])).sum(axis=1)
+        self._unequal_cycles = fire_cycles[~self._equal_cylinders]
+        if not len(self._unequal_cycles):
+            # Evenly spaced cylinders cancel out most harmonics, e.g. an inline 4 only has every 4th. Leave them out
+            audible = np.abs(firing_order) > 1e-6 * self.cylinders
+            harmonic_numbers = harmonic_numbers[audible]
+            firing_order = firing_order[audible]
+        self._harmonic_numbers = harmonic_numbers
+        self._firing_order = firing_order
+        self._harmonic_phases = np.zeros((len(harmonic_numbers), 0), dtype=np.float32)
+
+        # Every 25 RPM bucket from idle to the limiter is worked out here, so playing never has to. RPMs outside
+        # that range use the nearest end. Engines with the same sound and spec share the buckets
+        self._harmonic_keys = (round(self.idle_rpm / 25), max(round(self.limiter_rpm / 25), round(self.idle_rpm / 25)))
+        spec = (self.sample_rate, self.strokes, self._harmonic_keys, tuple(self._harmonic_numbers.tolist()),
+                tuple(self.timing), tuple(self._unequal_sec.tolist()))
+        self._harmonic_sets = sound_bank.shared(
+            self._fire_snd_work, ('harmonic',) + spec,
+            lambda: self._harmonic_spectra(range(self._harmonic_keys[0], self._harmonic_keys[1] + 1)))
+
+    def _harmonic_spectra(self, keys):
+        '''
+        Amplitude and phase offset of every harmonic for each 25 RPM bucket in `keys`: the spectrum of one stroke of
+        fire_snd at each harmonic's frequency, times the firing order's spectrum, scaled so one engine cycle peaks
+        at full volume.
+        '''
+        spectra = np.zeros((len(keys), len(self._harmonic_numbers)), dtype=np.complex128)
+        harmonic_rows = self._harmonic_numbers.astype(np.intp) - 1
+        rotations = np.zeros((harmonic_rows[-1] + 1, 0), dtype=np.complex128)
+        for i, key in enumerate(keys):
+            rpm = max(key * 25, 1)
+            cycles_per_sec = rpm / 60 * 2 / self.strokes
+            stroke = self._fire_snd_work[:min(math.ceil(self.sample_rate * 30 / rpm), len(self._fire_snd_work))]
+            sample_cycles = np.arange(len(stroke)) * (cycles_per_sec / self.sample_rate)
+
+            # Row h-1 is every sample's rotation at harmonic h, the 1st harmonic's to the power of h. Powers are
+            # multiplied together in doubling steps instead of calling np.exp for every harmonic
+            if len(stroke) > rotations.shape[1]:
+                rotations = np.zeros((len(rotations), len(stroke)), dtype=np.complex128)
+            powers = rotations[:, :len(stroke)]
+            np.exp(-2j * np.pi * sample_cycles, out=powers[0])
+            done = 1
+            while done < len(powers):
+                todo = min(done, len(powers) - done)
+                np.multiply(powers[:todo], powers[done - 1], out=powers[done:done + todo])
+                done += todo
+            spectra[i] = powers[harmonic_rows] @ stroke
+
+            firing_order = self._firing_order
+            if len(self._unequal_cycles):
+                delays = self._unequal_cycles + self._unequal_sec[~self._equal_cylinders] * cycles_per_sec
+                firing_order = firing_order + np.exp(-2j * np.pi * np.outer(self._harmonic_numbers, delays)).sum(axis=1)
+            spectra[i] *= firing_order
+
+        # One engine cycle sampled at 1024 points is the real part of the spectrum times each harmonic's rotation
+        grid = np.exp(1j * np.outer(self._harmonic_numbers, np.linspace(0, 2 * np.pi, 1024, endpoint=False)))
+        peaks = np.max(np.abs((spectra @ grid).real), axis=1)
+        scale = np.divide(cfg.max_16bit, peaks, out=np.zeros_like(peaks), where=peaks != 0)
+        amplitudes = (np.abs(spectra) * scale[:, None]).astype(np.float32)
+        offsets = np.angle(spectra).astype(np.float32)
+        amplitudes.setflags(write=False) # shared between engines, see sound_bank.shared
+        offsets.setflags(write=False)
+        return {key: (amplitudes[i], offsets[i, :, None]) for i, key in enumerate(keys)}
+
+    def _harmonic_set(self, rpm):
+        '''Amplitudes and phase offsets of the harmonics at `rpm`, from the nearest precomputed 25 RPM bucket'''
+        key = min(max(round(rpm / 25), self._harmonic_keys[0]), self._harmonic_keys[1])
+        return self._harmonic_sets[key]
+
+    def _gen_audio_harmonic(self, out):
+        '''Fills `out` with engine sound, RPM ramped from the end of the last call to the current RPM'''
+        num_samples = len(out)
+        if num_samples > len(self._harmonic_ramp):
+            self._harmonic_ramp = np.arange(1, num_samples + 1, dtype=np.float64)
+            self._harmonic_phases = np.zeros((len(self._harmonic_numbers), num_samples), dtype=np.float32)
+        amplitudes, offsets = self._harmonic_set(abs(self._rpm))
+
+        # Engine cycle phase after each sample, with RPM going linearly from the last block's to the current
+        cycles_per_rpm = 2 / (60 * self.strokes * self.sample_rate) # engine cycles per sample, per RPM
+        rpm = self._last_rpm
+        rpm_step = (abs(self._rpm) - rpm) / num_samples
+        ramp = self._harmonic_ramp[:num_samples]
+        cycle_phase = (rpm * ramp + rpm_step * ramp * (ramp + 1) / 2) * cycles_per_rpm + self._cycle_phase
+
+        phases = self._harmonic_phases[:, :num_samples]
+        # Only the fraction of a cycle matters, and keeps the phases small enough for float32
+        np.multiply.outer(self._harmonic_numbers * 2 * np.pi, cycle_phase - math.floor(cycle_phase[0]), out=phases,
+                          casting='same_kind')
+        phases += offsets
+        np.cos(phases, out=phases)
+        mix = amplitudes @ phases
+        np.clip(mix, -cfg.max_16bit, cfg.max_16bit, out=mix)
+        np.copyto(out, mix, casting='unsafe')
+
+        self.cycles_rendered += int(cycle_phase[-1])
+        self._cycle_phase = cycle_phase[-1] % 1
+        self._last_rpm = abs(self._rpm)
+        return out
+
+    def _scatter_cylinders(self, out, fire_snd, num_before, num_after):
+        '''
+        Adds the sound of every cylinder into `out`. A cylinder's sound is
+        between_fire_snd[:num_before], then fire_snd, then between_fire_snd[:num_after], starting at sample 0.
+        Sounds are added straight into slices of `out`, so nothing is allocated, and in cylinder order,
+        so the result is the same as summing one buffer per cylinder.
+        '''
+        num_fire = len(fire_snd)
+        between = self.between_fire_snd
+        for before, after in zip(num_before.tolist(), num_after.tolist()):
+            if not self._between_is_silent:
+                out[:before] += between[:before]
+                out[before+num_fire:before+num_fire+after] += between[:after]
+            out[before:before+num_fire] += fire_snd
+
+    def _next_engine_cycle(self):
+        '''One engine cycle at the current RPM, from the cycle cache if it's enabled'''
+        cache = self.cycle_cache
+        # Unequal engines carry sound over from one cycle into the next, so their cycles can't be reused
+        if cache is None or self._has_unequal:
+            return self._gen_audio_one_engine_cycle()
+
+        key = cache.bucket(self._rpm)
+        if key == 0:
+            return self._gen_audio_one_engine_cycle()
+        engine_snd = cache.get(key)
+        if engine_snd is None:
+            # Render at the bucket's RPM, so the cycle is the same whichever RPM in the bucket asked first
+            rpm = self._rpm
+            self._rpm = cache.bucket_rpm_of(key)
+            try:
+                engine_snd = self._gen_audio_one_engine_cycle()
+            finally:
+                self._rpm = rpm
+            cache.put(key, engine_snd.copy()) # the cycle buffer gets reused
+        return engine_snd
+
+    def enable_cycle_cache(self, bucket_rpm=25, max_bytes=8 * 2**20):
+        '''
+        Reuse rendered engine cycles for RPMs that come back (idle, rev limiter, steady cruising).
+        RPM is rounded to the nearest `bucket_rpm`, and at most `max_bytes` of cycles are kept.
+        Returns the cache, which counts hits and misses.
+        '''
+        self.cycle_cache = CycleCache(bucket_rpm, max_bytes)
+        return self.cycle_cache
+
+    def disable_cycle_cache(self):
+        self.cycle_cache = None
 
     def gen_audio(self, num_samples):
-        '''Return `num_samples` audio samples representing the engine running'''
-        # If we already have enough samples buffered, just return those
-        if num_samples < len(self._audio_buffer):
-            buf = self._audio_buffer[:num_samples]
-            self._audio_buffer = self._audio_buffer[num_samples:]
-            return buf
-
-        # Generate new samples. If we still don't have enough, loop what we generated
-        engine_snd = self._gen_audio_one_engine_cycle()
-        while len(self._audio_buffer) + len(engine_snd) < num_samples:
-            engine_snd = audio_tools.concat([engine_snd, engine_snd]) # this is unlikely to run more than once
-
-        # Take from the buffer first, and use new samples to make up the difference
-        # Leftover new samples become the audio buffer for the next run
-        num_new_samples = num_samples - len(self._audio_buffer)
-        buf = audio_tools.concat([self._audio_buffer, engine_snd[:num_new_samples]])
-        #assert len(buf) == num_samples, (f'${num_samples} requested, but ${len(buf)} samples provided, from ' +
-            #f'${len(self._audio_buffer)} buffered samples and ${num_new_samples} new samples')
-        self._audio_buffer = engine_snd[num_new_samples:]
-        return buf
-    
+        '''
+        Return `num_samples` audio samples representing the engine running.
+        The samples are a view into an output buffer that is reused by the next call, copy them to keep them.
+        '''
+        if num_samples > len(self._out_buffer):
+            self._out_buffer = np.zeros(num_samples, dtype=np.int16)
+        if self.mode == 'continuous':
+            return self._gen_audio_continuous(self._out_buffer[:num_samples])
+        if self.mode == 'harmonic':
+            return self._gen_audio_harmonic(self._out_buffer[:num_samples])
+
+        # Render whole engine cycles until enough samples are buffered
+        while len(self._audio_buffer) < num_samples:
+            engine_snd = self._next_engine_cycle()
+            self._audio_buffer.reserve(len(engine_snd)) # only grows for cycles longer than anything seen so far
+            self._audio_buffer.write(engine_snd)
+            self.cycles_rendered += 1
+
+        return self._audio_buffer.read_into(self._out_buffer[:num_samples])
+
+    @property
+    def buffered_samples(self):
+        '''Number of samples rendered but not yet handed out by gen_audio'''
+        return len(self._audio_buffer)
+
     def throttle(self, fraction):
         '''Applies throttle, increasing or decreasing the engine's RPM based on friction, power etc'''
         if fraction == 1.0:
@@ -222,9 +478,6 @@ class Engine:
                 #self._rpm -= min(125, self._rpm - self.idle_rpm)
                 self._rpm -= min(50, self._rpm - self.idle_rpm)
 
-        #print("\033[A                             \033[A") # clear previous line in console
-        print('RPM', self._rpm, end="\r")
-
     def specific_rpm(self, rpm):  # TODO
         self._rpm = rpm
         #print(rpm)
@@ -1,271 +1,318 @@
 # Reference: https://en.wikipedia.org/wiki/Big-bang_firing_order
 
+# Presets are registered by name and describe an engine as Engine keyword arguments. Sounds are
+# only synthesised the first time an engine is built, and are shared (read-only) between engines.
+# Engines at other sample rates get the sounds resampled once per rate (see sound_bank.resampled).
+
+from engine_sound_sim import cfg
 from engine_sound_sim import synth
 from engine_sound_sim import audio_tools
+from engine_sound_sim import sound_bank
 from engine_sound_sim.engine import Engine
+import functools
+import math
+import numpy as np
 import random as rd
 
-_fire_snd = synth.sine_wave_note(frequency=160, duration=1)
-audio_tools.normalize_volume(_fire_snd)
-audio_tools.exponential_volume_dropoff(_fire_snd, duration=0.06, base=5)
+_presets = {}
+
+@functools.lru_cache(maxsize=None)
+def fire_snd():
+    '''Sound of a cylinder firing, shared by all presets'''
+    snd = synth.sine_wave_note(frequency=160, duration=1)
+    audio_tools.normalize_volume(snd)
+    audio_tools.exponential_volume_dropoff(snd, duration=0.06, base=5)
+    snd.setflags(write=False)
+    return snd
+
+@functools.lru_cache(maxsize=None)
+def silence(duration, sample_rate=None):
+    '''Shared silence buffer, for between_fire_snd'''
+    snd = np.zeros(math.ceil(duration * (sample_rate or cfg.sample_rate)))
+    snd.setflags(write=False)
+    return snd
+
+def _preset(spec_func):
+    '''
+    Registers `spec_func` as a preset. It returns Engine keyword arguments, without the sounds:
+    fire_snd is always fire_snd(), and between_fire_snd is silence(<'silence' key, default 1 second>).
+    The decorated function builds the Engine, so presets can still be called directly, and takes
+    a `sample_rate` keyword for engines that don't run at cfg.sample_rate and a `mode` keyword
+    to override the preset's Engine mode (e.g. 'harmonic', see Engine).
+    '''
+    @functools.wraps(spec_func)
+    def create_preset(*args, sample_rate=None, mode=None, **kwargs):
+        spec = spec_func(*args, **kwargs)
+        if mode is not None:
+            spec = dict(spec, mode=mode)
+        return Engine(**_with_sounds(spec, sample_rate))
+
+    create_preset.spec = spec_func
+    _presets[spec_func.__name__] = create_preset
+    return create_preset
+
+def _with_sounds(spec, sample_rate=None):
+    spec = dict(spec)
+    sample_rate = sample_rate or cfg.sample_rate
+    spec['fire_snd'] = sound_bank.resampled(fire_snd(), cfg.sample_rate, sample_rate)
+    spec['between_fire_snd'] = silence(spec.pop('silence', 1), sample_rate)
+    spec['sample_rate'] = sample_rate
+    return spec
+
+def names():
+    '''Names of all the presets, in the order they're defined'''
+    return list(_presets)
+
+def spec(name, *args, **kwargs):
+    '''Engine keyword arguments of preset `name` (without the sounds), see _preset'''
+    return _presets[name].spec(*args, **kwargs)
+
+def create(name, *args, **kwargs):
+    '''
+    Builds the Engine of preset `name`. Extra arguments go to the preset, e.g. V_12(rando),
+    or set the engine's sample_rate or mode
+    '''
+    if name not in _presets:
+        raise ValueError(f'Unknown engine preset {name!r}, see engine_factory.names()')
+    return _presets[name](*args, **kwargs)
 
+@_preset
 def v_twin_90_deg():
     '''Suzuki SV650/SV1000, Yamaha MT-07'''
-    return Engine(
+    return dict(
         idle_rpm=1000,
         limiter_rpm=10500,
         strokes=4,
         cylinders=2,
-        timing=[270, 450],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[270, 450]
     )
 
+@_preset
 def v_twin_60_deg():
-    return Engine(
+    return dict(
         idle_rpm=1100,
         limiter_rpm=10500,
         strokes=4,
         cylinders=2,
-        timing=[300, 420],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[300, 420]
     )
 
+@_preset
 def v_twin_45_deg():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=2,
-        timing=[315, 405],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[315, 405]
     )
 
+@_preset
 def inline_4():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7800,
         strokes=4,
         cylinders=4,
-        timing=[180, 180, 180, 180],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 180, 180, 180]
     )
 
+@_preset
 def inline_7():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7800,
         strokes=4,
         cylinders=7,
-        timing=[103, 103, 103, 103, 103, 103, 102],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[103, 103, 103, 103, 103, 103, 102]
     )
 
+@_preset
 def inline_6():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7800,
         strokes=4,
         cylinders=6,
-        timing=[120, 120, 120, 120, 120, 120],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[120, 120, 120, 120, 120, 120]
     )
 
+@_preset
 def formula_one():
-    return Engine(
+    return dict(
         idle_rpm=750,
         limiter_rpm=15000,
         strokes=4,
         cylinders=6,
         timing=[120]*6,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(3)
+        silence=3
     )
 
+@_preset
 def v_8_LR():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=8,
-        timing=[90]*8,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[90]*8
     )
 
+@_preset
 def v_8_LS():
-    return Engine(
+    return dict(
         idle_rpm=600,
         limiter_rpm=7000,
         strokes=4,
         cylinders=8,
-        timing=[180, 270, 180, 90, 180, 270, 180, 90],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 270, 180, 90, 180, 270, 180, 90]
     )
 
+@_preset
 def v_8_FP():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=8,
-        timing=[180]*8,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180]*8
     )
 
+@_preset
 def v_8_FP_TVR():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=8,
-        timing=[75]*8,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[75]*8
     )
 
+@_preset
 def w_16():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=16,
-        timing=[27, 90-27, 27, 180-117, 27, 270-207, 27, 360-297, 27, 90-27, 27, 180-117, 27, 270-207, 27, 360-297],
+        timing=[27, 90-27, 27, 180-117, 27, 270-207, 27, 360-297, 27, 90-27, 27, 180-117, 27, 270-207, 27, 360-297]
         #timing=[180, 270, 180, 90],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
     )
 
+@_preset
 def inline_9():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=9,
-        timing=[80]*9,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[80]*9
     )
 
+@_preset
 def inline_1():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=1,
-        timing=[720],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[720]
     )
 
+@_preset
 def inline_7_4_3():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=9000,
         strokes=4,
         cylinders=7,
-        timing=[180, 90, 180, 270]+[240]*3,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 90, 180, 270]+[240]*3
     )
 
+@_preset
 def inline_16():
     whynot=16
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7000,
         strokes=4,
         cylinders=whynot,
-        timing=[720/whynot]*whynot,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[720/whynot]*whynot
     )
 
+@_preset
 def inline_5():
     whynot=5
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=9000,
         strokes=4,
         cylinders=whynot,
-        timing=[720/whynot]*whynot,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[720/whynot]*whynot
     )
 
+@_preset
 def inline_any():
     whynot=5
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=9000,
         strokes=4,
         cylinders=whynot,
-        timing=[720/whynot]*whynot,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[720/whynot]*whynot
     )
 
+@_preset
 def inline_5_crossplane():
     whynot=5
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=9000,
         strokes=4,
         cylinders=whynot,
-        timing=[180, 90, 180, 90, 180],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 90, 180, 90, 180]
     )
 
+@_preset
 def inline_4_uneven_firing():
     whynot=4
     mini = 170
     maxi = 190
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7800,
         strokes=4,
         cylinders=whynot,
-        timing=[rd.uniform(mini, maxi), rd.uniform(mini, maxi), rd.uniform(mini, maxi), rd.uniform(mini, maxi)],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[rd.uniform(mini, maxi), rd.uniform(mini, maxi), rd.uniform(mini, maxi), rd.uniform(mini, maxi)]
     )
 
+@_preset
 def boxer_4_crossplane_custom(rando=[0]*4):  #wrx
     whynot=4
     because=180
     #because=rando
-    return Engine(
+    return dict(
         idle_rpm=750,
         limiter_rpm=6700,
         strokes=4,
         cylinders=whynot,
         timing=[because, 360-because]*2,
         #timing = [180, 270, 180, 90],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1),
         unequal=rando
     )
 
+@_preset
 def boxer_4_half():
     whynot=2
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=6700,
         strokes=4,
         cylinders=whynot,
-        timing=[180, 720-180],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 720-180]
     )
 
+@_preset
 def random():
     #whynot=rd.choice([4, 8, 16])
     whynot=4
@@ -275,59 +322,53 @@ def random():
         rando = rd.randrange(int(360/5/whynot), int(1440/5/whynot))*5
     randlist = [rd.randrange(int(360/5/whynot), int(1440/5/whynot))*5 for x in range(whynot)]
     print(randlist)
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=9000,
         strokes=4,
         cylinders=whynot,
-        timing=randlist,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=randlist
     )
 
+@_preset
 def v_four_90_deg():
-    return Engine(
+    return dict(
         idle_rpm=1100,
         limiter_rpm=16500,
         strokes=4,
         cylinders=4,
-        timing=[180, 90, 180, 270],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 90, 180, 270]
     )
 
+@_preset
 def fake_rotary_2rotor():
     difference = 60
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=8300,
         strokes=2,
         cylinders=2,
         #timing=[90, 720-90],
-        timing = [difference, 720-difference],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing = [difference, 720-difference]
     )
 
+@_preset
 def inline_4_1_spark_plug_disconnected():
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=7800,
         strokes=4,
         cylinders=3,
-        timing=[180, 360, 180],
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1)
+        timing=[180, 360, 180]
     )
 
+@_preset
 def V_12(rando=[0]*12):
-    return Engine(
+    return dict(
         idle_rpm=800,
         limiter_rpm=9000,
         strokes=4,
         cylinders=12,
         timing=[60]*12,
-        fire_snd=_fire_snd,
-        between_fire_snd=synth.silence(1),
         unequal=rando
     )
@@ -0,0 +1,176 @@
+'''Mixes many engines (e.g. a field of cars) into one audio stream'''
+
+from engine_sound_sim import cfg
+from engine_sound_sim import spatial
+
+import time
+import numpy as np
+
+class Mixer:
+    def __init__(self, max_sources=None, master_gain=1.0, ref_distance=1.0, rolloff=1.0, min_gain=1e-3, channels=1,
+                 sample_rate=None):
+        '''
+        Holds any number of engines, each with its own gain and distance from the listener, and mixes them
+        into one block of int16 samples. gen_audio() matches Engine.gen_audio(), so a Mixer can be passed
+        anywhere an engine's gen_audio can, e.g. AudioDevice.play_stream(mixer.gen_audio).
+
+        Engines quieter than `min_gain` after attenuation aren't rendered at all, and only the loudest
+        `max_sources` are, so the cost of a block is capped however many cars there are.
+
+        max_sources: most engines rendered per block, None for no limit
+        master_gain: applied to the whole mix. Engines are rendered at full volume, so several loud ones
+          together clip unless this is brought down
+        ref_distance: distance at (and within) which an engine is heard at its own gain
+        rolloff: 1 halves the volume each time the distance doubles past ref_distance, higher falls off faster
+        min_gain: engines whose attenuated gain is below this are skipped
+        channels: 1, or 2 for interleaved stereo with each engine panned (see set_pan and place), for
+          AudioDevice.play_stream(mixer.gen_audio, channels=2)
+        sample_rate: of the engines, defaults to cfg.sample_rate. Only used for cpu_load
+        '''
+        assert max_sources is None or max_sources > 0, 'max_sources <= 0'
+        assert ref_distance > 0, 'ref_distance <= 0'
+        assert channels in (1, 2), 'channels not 1 or 2'
+        self.max_sources = max_sources
+        self.master_gain = master_gain
+        self.ref_distance = ref_distance
+        self.rolloff = rolloff
+        self.min_gain = min_gain
+        self.channels = channels
+        self.sample_rate = sample_rate or cfg.sample_rate
+
+        # One slot per source, removed sources leave an empty slot (engine None, not active) for the next add()
+        self._engines = []
+        self._active = np.zeros(0, dtype=bool)
+        self._resamplers = [] # spatial.Resampler once a source has had a Doppler shift, else None
+        self._gains = np.zeros(0)
+        self._distances = np.zeros(0)
+        self._pans = np.zeros(0)
+        self._dopplers = np.ones(0)
+
+        self._rows = np.zeros((0, 0), dtype=np.float32) # rendered block of each audible source
+        self._mix = np.zeros((channels, 0), dtype=np.float32)
+        self._out_buffer = np.zeros((0, channels), dtype=np.int16)
+
+        self.rendered_sources = 0 # sources rendered for the last block
+        self.cpu_load = 0.0 # time the last block took to render, as a fraction of its duration
+
+    def __len__(self):
+        return sum(engine is not None for engine in self._engines)
+
+    def add(self, engine, gain=1.0, distance=0.0, pan=0.0):
+        '''Adds `engine`, returns its source index for set_gain, set_distance and remove'''
+        if None in self._engines:
+            source = self._engines.index(None)
+            self._engines[source] = engine
+        else:
+            source = len(self._engines)
+            self._engines.append(engine)
+            self._active = np.append(self._active, False)
+            self._resamplers.append(None)
+            self._gains = np.append(self._gains, 0.0)
+            self._distances = np.append(self._distances, 0.0)
+            self._pans = np.append(self._pans, 0.0)
+            self._dopplers = np.append(self._dopplers, 1.0)
+        self._active[source] = True
+        self._resamplers[source] = None
+        self._gains[source] = gain
+        self._distances[source] = distance
+        self._pans[source] = pan
+        self._dopplers[source] = 1.0
+        return source
+
+    def remove(self, source):
+        self._engines[source] = None
+        self._active[source] = False
+        self._resamplers[source] = None
+        self._gains[source] = 0.0
+
+    def engine(self, source):
+        return self._engines[source]
+
+    def set_gain(self, source, gain):
+        assert self._engines[source] is not None, 'source has been removed'
+        self._gains[source] = gain
+
+    def set_distance(self, source, distance):
+        self._distances[source] = distance
+
+    def set_distances(self, distances):
+        '''Sets the distance of every source at once, `distances` is indexed by source'''
+        self._distances[:] = distances
+
+    def set_pan(self, source, pan):
+        '''-1 (left) to 1 (right), stereo only'''
+        self._pans[source] = pan
+
+    def set_doppler(self, source, factor):
+        '''Plays the source `factor` times faster (higher pitched), see spatial.relative'''
+        self._dopplers[source] = factor
+
+    def place(self, positions, velocities, listener_position, listener_velocity=(0, 0), speed_of_sound=343.0):
+        '''
+        Sets the distance, pan and Doppler of every source from its position and velocity relative to the
+        listener, e.g. each car's and the camera's. Arrays of (x, y) indexed by source, see spatial.relative.
+        '''
+        self._distances[:], self._pans[:], self._dopplers[:] = spatial.relative(
+            positions, velocities, listener_position, listener_velocity, self.ref_distance, speed_of_sound)
+
+    def effective_gains(self):
+        '''Gain of each source after distance attenuation and master gain'''
+        attenuation = self.ref_distance / np.maximum(self._distances, self.ref_distance)
+        if self.rolloff != 1:
+            attenuation **= self.rolloff
+        return self._gains * attenuation * self.master_gain
+
+    def _audible(self, gains):
+        '''Indices of the sources to render: audible ones, loudest max_sources of them if there are too many'''
+        audible = np.flatnonzero(self._active & (np.abs(gains) >= self.min_gain))
+        if self.max_sources is not None and len(audible) > self.max_sources:
+            loudest = np.argpartition(-np.abs(gains[audible]), self.max_sources - 1)[:self.max_sources]
+            audible = audible[loudest]
+        return audible
+
+    def _render(self, row, source):
+        resampler = self._resamplers[source]
+        if resampler is None and self._dopplers[source] == 1.0:
+            row[:] = self._engines[source].gen_audio(len(row))
+            return
+        if resampler is None:
+            resampler = self._resamplers[source] = spatial.Resampler(self._engines[source].gen_audio)
+        resampler.factor = self._dopplers[source]
+        resampler.fill(row)
+
+    def gen_audio(self, num_samples):
+        '''
+        Return `num_samples` audio samples (frames, in stereo, interleaved) of all the engines mixed together.
+        The samples are a view into an output buffer that is reused by the next call, copy them to keep them.
+        '''
+        start = time.perf_counter()
+        if num_samples > len(self._out_buffer):
+            self._out_buffer = np.zeros((num_samples, self.channels), dtype=np.int16)
+            self._mix = np.zeros((self.channels, num_samples), dtype=np.float32)
+        out = self._out_buffer[:num_samples]
+        mix = self._mix[:, :num_samples]
+
+        gains = self.effective_gains()
+        audible = self._audible(gains)
+        if len(audible) > len(self._rows) or num_samples > self._rows.shape[1]:
+            self._rows = np.zeros((max(len(audible), len(self._rows)), max(num_samples, self._rows.shape[1])),
+                                  dtype=np.float32)
+        rows = self._rows[:len(audible), :num_samples]
+
+        for row, source in zip(rows, audible):
+            self._render(row, source)
+
+        # Weighted sum of every rendered block at once, one row of weights per channel
+        weights = gains[audible]
+        if self.channels == 2:
+            weights = weights * spatial.pan_gains(self._pans[audible])
+        np.matmul(weights.astype(np.float32).reshape(self.channels, -1), rows, out=mix)
+
+        np.clip(mix, -cfg.max_16bit, cfg.max_16bit, out=mix)
+        np.copyto(out, mix.T, casting='unsafe')
+
+        self.rendered_sources = len(audible)
+        self.cpu_load = (time.perf_counter() - start) / (num_samples / self.sample_rate)
+        return out.reshape(-1)
@@ -0,0 +1,112 @@
+'''
+Offline rendering of an engine following an RPM trace, straight to a file and without an audio device.
+Audio is streamed out in chunks, so traces of any length render in constant memory.
+
+Usage: python -m engine_sound_sim.render <engine_factory preset> <out.wav|out.npy> [--rpm START END] [--seconds N]
+                                         [--sample-rate HZ]
+'''
+
+from engine_sound_sim import engine_factory
+
+import argparse
+import math
+import time
+import wave
+import numpy as np
+
+def rpm_sweep(start_rpm, end_rpm, duration):
+    '''RPM trace (times, rpms) going linearly from `start_rpm` to `end_rpm` over `duration` seconds'''
+    return np.array([0, duration]), np.array([start_rpm, end_rpm])
+
+def _chunks(engine, times, rpms, chunk_size):
+    '''Yields the engine's audio in chunks, with RPM interpolated from the trace at the start of each chunk'''
+    assert len(times) == len(rpms) and len(times) > 0, 'times and rpms must be the same non-zero length'
+    num_samples = math.ceil(times[-1] * engine.sample_rate)
+    for start in range(0, num_samples, chunk_size):
+        engine.specific_rpm(float(np.interp(start / engine.sample_rate, times, rpms)))
+        yield engine.gen_audio(min(chunk_size, num_samples - start))
+
+class _WavWriter:
+    def __init__(self, path, sample_rate):
+        self._wav = wave.open(str(path), 'wb')
+        self._wav.setnchannels(1)
+        self._wav.setsampwidth(2) # int16
+        self._wav.setframerate(sample_rate)
+
+    def write(self, samples):
+        self._wav.writeframes(samples.astype('<i2', copy=False).tobytes())
+
+    def close(self):
+        self._wav.close()
+
+class _NpyWriter:
+    def __init__(self, path, num_samples):
+        self._out = np.lib.format.open_memmap(str(path), mode='w+', dtype=np.int16, shape=(num_samples,))
+        self._pos = 0
+
+    def write(self, samples):
+        self._out[self._pos:self._pos+len(samples)] = samples
+        self._pos += len(samples)
+
+    def close(self):
+        self._out.flush()
+        del self._out
+
+def render(engine, times, rpms, path, chunk_size=4096):
+    '''
+    Renders `engine` following an RPM trace and writes it to `path`, a .wav or memory-mapped .npy file,
+    at the engine's sample rate.
+
+    times: seconds, increasing from 0. The trace lasts until the last time
+    rpms: engine RPM at each of `times`, interpolated in between
+    chunk_size: samples rendered at a time, i.e. how often the RPM is updated
+
+    Returns a dict with the number of samples, the audio and render durations and the realtime factor
+    (seconds of audio rendered per second of wall time).
+    '''
+    num_samples = math.ceil(times[-1] * engine.sample_rate)
+    if str(path).endswith('.npy'):
+        writer = _NpyWriter(path, num_samples)
+    elif str(path).endswith('.wav'):
+        writer = _WavWriter(path, engine.sample_rate)
+    else:
+        raise ValueError(f'Can only render to .wav or .npy files, not {path}')
+
+    start = time.perf_counter()
+    try:
+        for samples in _chunks(engine, times, rpms, chunk_size):
+            writer.write(samples)
+    finally:
+        writer.close()
+    render_time = time.perf_counter() - start
+
+    duration = num_samples / engine.sample_rate
+    return {
+        'samples': num_samples,
+        'duration': duration,
+        'render_time': render_time,
+        'realtime_factor': duration / render_time if render_time else math.inf,
+    }
+
+def render_array(engine, times, rpms, chunk_size=4096):
+    '''Same as render(), but returns the int16 samples instead of writing them to a file'''
+    return np.concatenate([samples.copy() for samples in _chunks(engine, times, rpms, chunk_size)])
+
+def main():
+    parser = argparse.ArgumentParser(description='Render an engine_factory engine sweeping through RPM to a file')
+    parser.add_argument('engine', help="engine_factory preset, e.g. inline_6")
+    parser.add_argument('path', help='.wav or .npy file to write')
+    parser.add_argument('--rpm', nargs=2, type=float, metavar=('START', 'END'),
+                        help='RPM at the start and end (default: idle to limiter)')
+    parser.add_argument('--seconds', type=float, default=10, help='length of the sweep')
+    parser.add_argument('--sample-rate', type=int, help='Hz (default: cfg.sample_rate)')
+    args = parser.parse_args()
+
+    engine = engine_factory.create(args.engine, sample_rate=args.sample_rate)
+    start_rpm, end_rpm = args.rpm or (engine.idle_rpm, engine.limiter_rpm)
+    stats = render(engine, *rpm_sweep(start_rpm, end_rpm, args.seconds), args.path)
+    print(f"{args.engine}: {stats['duration']:.1f}s of audio in {stats['render_time']:.2f}s "
+          f"({stats['realtime_factor']:.0f}x realtime)")
+
+if __name__ == '__main__':
+    main()
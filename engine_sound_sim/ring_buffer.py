@@ -0,0 +1,69 @@
+'''Fixed-capacity sample FIFO that doesn't allocate when samples go in or out'''
+
+import numpy as np
+
+class RingBuffer:
+    def __init__(self, capacity, dtype=np.int16):
+        '''
+        capacity: number of samples that can be held at once
+        dtype: sample type, int16 for samples in playback format
+        '''
+        assert capacity > 0, 'capacity <= 0'
+        self._buf = np.zeros(capacity, dtype=dtype)
+        self._read = 0 # index of the oldest sample
+        self._fill = 0 # number of samples held
+
+    def __len__(self):
+        return self._fill
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    @property
+    def free(self):
+        return len(self._buf) - self._fill
+
+    @property
+    def dtype(self):
+        return self._buf.dtype
+
+    def write(self, samples):
+        '''Appends `samples`, which must fit in the free space'''
+        num_samples = len(samples)
+        assert num_samples <= self.free, f'{num_samples} samples written, but only {self.free} free'
+
+        start = (self._read + self._fill) % len(self._buf)
+        first = min(num_samples, len(self._buf) - start) # samples before wrapping round to the start
+        self._buf[start:start+first] = samples[:first]
+        self._buf[:num_samples-first] = samples[first:]
+        self._fill += num_samples
+
+    def read_into(self, out):
+        '''Removes the oldest len(out) samples and copies them into `out`, returns `out`'''
+        num_samples = len(out)
+        assert num_samples <= self._fill, f'{num_samples} samples requested, but only {self._fill} held'
+
+        first = min(num_samples, len(self._buf) - self._read)
+        out[:first] = self._buf[self._read:self._read+first]
+        out[first:] = self._buf[:num_samples-first]
+        self._read = (self._read + num_samples) % len(self._buf)
+        self._fill -= num_samples
+        return out
+
+    def reserve(self, num_free):
+        '''Grows the buffer (keeping its contents) so at least `num_free` samples can be written'''
+        if num_free <= self.free:
+            return
+
+        capacity = len(self._buf)
+        while capacity - self._fill < num_free:
+            capacity *= 2
+        held = self.read_into(np.empty(self._fill, dtype=self._buf.dtype))
+        self._buf = np.zeros(capacity, dtype=self._buf.dtype)
+        self._read = 0
+        self.write(held)
+
+    def clear(self):
+        self._read = 0
+        self._fill = 0
@@ -0,0 +1,98 @@
+'''
+Soak test of the real-time audio path without a sound card: an engine following a random RPM trace is
+played through AudioDevice on a NullBackend, and the callback times, underflows and buffer depths are reported.
+The RPM trace follows the simulated clock, so without --realtime the audio is the same on every run with the
+same seed, with --ahead-ms too: the AudioProducer then renders in step with the simulated clock instead of on a thread.
+
+Usage: python -m engine_sound_sim.soak <engine_factory preset> [--seconds N] [--block-size N] [--ahead-ms N]
+                                       [--sample-rate HZ] [--realtime] [--wav out.wav] [--export stats.json|csv]
+'''
+
+from engine_sound_sim import audio_backend
+from engine_sound_sim import engine_factory
+from engine_sound_sim.audio_device import AudioDevice
+from engine_sound_sim.stats import AudioStats
+
+import argparse
+import time
+import numpy as np
+
+def rpm_trace(engine, seconds, seed=0, step=0.5):
+    '''Random walk (times, rpms) between idle and limiter, with a new target RPM every `step` seconds'''
+    rng = np.random.default_rng(seed)
+    times = np.arange(0, seconds + step, step)
+    rpms = rng.uniform(engine.idle_rpm, engine.limiter_rpm, len(times))
+    return times, rpms
+
+def run(name, seconds=60, block_size=512, ahead_ms=None, sample_rate=None, realtime=False, path=None, seed=0):
+    '''
+    Plays preset `name` for `seconds` of simulated time and returns the stats snapshot, with the stream's
+    own underflow count and the latency the block size and ahead_ms add.
+
+    realtime: pace callbacks with the wall clock, as a sound card would (takes `seconds` to run). Otherwise
+      the audio is rendered as fast as possible, and a callback slower than its block counts as an underflow.
+      With ahead_ms that includes topping up the producer's queue, which a thread would do in realtime
+    path: .wav file to write the audio to
+    '''
+    engine = engine_factory.create(name, sample_rate=sample_rate)
+    times, rpms = rpm_trace(engine, seconds, seed)
+    frames_played = 0
+    def callback(num_frames):
+        nonlocal frames_played
+        engine.specific_rpm(float(np.interp(frames_played / engine.sample_rate, times, rpms)))
+        frames_played += num_frames
+        return engine.gen_audio(num_frames)
+
+    stats = AudioStats()
+    stats.watch(engine=engine)
+    audio_device = AudioDevice(engine.sample_rate, block_size, audio_backend.NullBackend(path, realtime))
+    stream = audio_device.play_stream(callback, ahead_ms, stats=stats)
+    try:
+        if realtime:
+            time.sleep(seconds)
+        else:
+            stream.run(seconds)
+    finally:
+        stream.close()
+        audio_device.close()
+
+    snapshot = stats.snapshot()
+    snapshot.update(
+        preset=name,
+        seconds=stream.clock,
+        sample_rate=engine.sample_rate,
+        block_size=block_size,
+        stream_underflows=stream.underflows,
+        latency_ms=(block_size / engine.sample_rate * 1000) + (ahead_ms or 0),
+    )
+    return snapshot, stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Play an engine through the audio path without a sound card')
+    parser.add_argument('engine', help='engine_factory preset, e.g. inline_6')
+    parser.add_argument('--seconds', type=float, default=60, help='simulated seconds to play')
+    parser.add_argument('--block-size', type=int, default=512, help='frames per device callback')
+    parser.add_argument('--ahead-ms', type=float, help='render ahead on an AudioProducer thread')
+    parser.add_argument('--sample-rate', type=int, help='Hz (default: cfg.sample_rate)')
+    parser.add_argument('--realtime', action='store_true', help='pace callbacks with the wall clock')
+    parser.add_argument('--wav', help='write the audio to this file')
+    parser.add_argument('--seed', type=int, default=0, help='of the random RPM trace')
+    parser.add_argument('--export', metavar='PATH', help='write the stats to a .json or .csv file')
+    args = parser.parse_args()
+
+    snapshot, stats = run(args.engine, args.seconds, args.block_size, args.ahead_ms, args.sample_rate,
+                          args.realtime, args.wav, args.seed)
+    if args.export:
+        stats.export(args.export)
+    print(f"{snapshot['preset']}: {snapshot['seconds']:.1f}s at {snapshot['sample_rate']}Hz, "
+          f"{snapshot['block_size']} frame blocks ({snapshot['latency_ms']:.1f}ms latency)")
+    print(f"callbacks {snapshot['callbacks']}, underflows {snapshot['stream_underflows']}, "
+          f"producer underruns {snapshot['producer_underruns']}, max buffer depth {snapshot['buffer_depth_max']}, "
+          f"{snapshot['cycles_per_sec']:.0f} cycles/s")
+    print(f"callback ms: mean {snapshot['callback_ms_mean']:.3f}, max {snapshot['callback_ms_max']:.3f}")
+    for bucket, count in snapshot['callback_ms_histogram'].items():
+        if count:
+            print(f'  {bucket:>9} {count}')
+
+if __name__ == '__main__':
+    main()
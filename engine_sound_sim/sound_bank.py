@@ -0,0 +1,98 @@
+'''
+Cache of sounds that are the same for every engine using them (dropoff envelopes, fire sounds converted
+for mixing, harmonic mode tables), so they're prepared once and shared as read-only arrays instead of rebuilt
+per call or per engine.
+'''
+
+from engine_sound_sim import cfg
+
+from collections import OrderedDict
+import math
+import numpy as np
+
+# prepared(), resampled() and shared() keep the sounds they were given alive (so their ids can't be reused by another
+# sound), only the most recently used ones, so sounds that are no longer used can be freed
+MAX_SOUNDS = 8
+
+_envelopes = {}
+_prepared = OrderedDict()
+_resampled = OrderedDict()
+_shared = OrderedDict()
+
+def _read_only(buf):
+    buf.setflags(write=False)
+    return buf
+
+def _lookup(cache, key):
+    entry = cache.get(key)
+    if entry is not None:
+        cache.move_to_end(key)
+    return entry
+
+def _store(cache, key, entry):
+    cache[key] = entry
+    if len(cache) > MAX_SOUNDS:
+        cache.popitem(last=False)
+    return entry
+
+def dropoff_envelope(duration, base, sample_rate=None):
+    '''Exponential dropoff curve lasting `duration` seconds, see audio_tools.exponential_volume_dropoff'''
+    sample_rate = sample_rate or cfg.sample_rate
+    key = (duration, base, sample_rate)
+    envelope = _envelopes.get(key)
+    if envelope is None:
+        num_samples = math.ceil(duration * sample_rate)
+        envelope = _envelopes[key] = _read_only(base / np.logspace(1, 10, num=num_samples, base=base))
+    return envelope
+
+def prepared(snd, dtype, scale=1):
+    '''
+    `snd` multiplied by `scale` and converted to `dtype` (truncated, for integer types).
+    Engines built from the same sound share one copy, `snd` itself if nothing needs changing.
+    Copies of the MAX_SOUNDS most recently used sounds are kept.
+    '''
+    dtype = np.dtype(dtype)
+    if dtype == snd.dtype and scale == 1 and not snd.flags.writeable:
+        return snd
+
+    key = (id(snd), dtype, scale)
+    entry = _lookup(_prepared, key)
+    if entry is None: # entries keep `snd` alive, so its id can't be reused by another sound
+        buf = snd * scale if scale != 1 else snd
+        entry = _store(_prepared, key, (snd, _read_only(buf.astype(dtype))))
+    return entry[1]
+
+def resampled(snd, from_rate, to_rate):
+    '''
+    `snd` recorded at `from_rate` converted to `to_rate`, by linear interpolation. Like prepared(), engines
+    built from the same sound share one copy, and `snd` itself comes back if the rates are the same.
+    '''
+    if from_rate == to_rate:
+        return snd
+
+    key = (id(snd), from_rate, to_rate)
+    entry = _lookup(_resampled, key)
+    if entry is None: # entries keep `snd` alive, so its id can't be reused by another sound
+        # Rounded up, so a sound that lasts at least a second still does at any rate
+        num_samples = math.ceil(len(snd) * to_rate / from_rate)
+        times = np.arange(num_samples) * (from_rate / to_rate) # positions in `snd` of every new sample
+        buf = np.interp(times, np.arange(len(snd)), snd).astype(snd.dtype, copy=False)
+        entry = _store(_resampled, key, (snd, _read_only(buf)))
+    return entry[1]
+
+def shared(snd, key, build):
+    '''
+    What build() returns for sound `snd` and `key` (everything else it depends on, hashable), e.g. an engine's
+    harmonic tables. Built by the first engine to ask, engines with the same sound and key get the same one back.
+    '''
+    key = (id(snd), key)
+    entry = _lookup(_shared, key)
+    if entry is None: # entries keep `snd` alive, so its id can't be reused by another sound
+        entry = _store(_shared, key, (snd, build()))
+    return entry[1]
+
+def clear():
+    _envelopes.clear()
+    _prepared.clear()
+    _resampled.clear()
+    _shared.clear()
@@ -0,0 +1,138 @@
+'''Stereo placement of sounds: panning, distance and Doppler from where a source is relative to the listener'''
+
+from engine_sound_sim import cfg
+
+import numpy as np
+
+def pan_gains(pan):
+    '''Equal-power (left, right) gains for `pan` from -1 (left) to 1 (right). Works on arrays of pans too'''
+    angle = (np.clip(pan, -1, 1) + 1) * (np.pi / 4)
+    return np.cos(angle), np.sin(angle)
+
+def relative(position, velocity, listener_position, listener_velocity=(0, 0), ref_distance=1.0,
+             speed_of_sound=343.0):
+    '''
+    Where sources are relative to the listener, in any 2D units (e.g. pixels and pixels per frame)
+    as long as `speed_of_sound` is in the same ones. `position` and `velocity` are (x, y) or arrays of them.
+
+    Returns (distance, pan, doppler):
+      pan: -1 (left) to 1 (right), sine of the source's angle from straight ahead (+y)
+      doppler: factor the source's pitch is multiplied by, above 1 when approaching
+    '''
+    offset = np.asarray(position, dtype=np.float64) - listener_position
+    closing = np.asarray(velocity, dtype=np.float64) - listener_velocity
+    distance = np.hypot(offset[..., 0], offset[..., 1])
+    # Within ref_distance the source is treated as on top of the listener: centred, no Doppler
+    scale = 1 / np.maximum(distance, ref_distance)
+    pan = offset[..., 0] * scale
+    receding = (offset[..., 0] * closing[..., 0] + offset[..., 1] * closing[..., 1]) * scale
+    doppler = speed_of_sound / np.maximum(speed_of_sound + receding, 0.5 * speed_of_sound)
+    return distance, pan, np.minimum(doppler, 2.0)
+
+class Resampler:
+    def __init__(self, source):
+        '''
+        Plays `source` faster or slower by `factor`, for Doppler shift, with linear interpolation.
+        Changes of factor are ramped over a block so they don't click.
+
+        source: function taking a number of samples and returning that many int16 samples, e.g. Engine.gen_audio
+        '''
+        self._source = source
+        self.factor = 1.0
+        self._last_factor = 1.0
+        self._pos = 0.0 # read position into self._pending, which starts at the oldest source sample still needed
+        self._pending = np.zeros(1, dtype=np.float32)
+        self._work = np.zeros(0, dtype=np.float32)
+        self._ramp = np.zeros(0)
+        self._positions = np.zeros(0)
+        self._indices = np.zeros(0, dtype=np.intp)
+
+    def _fetch(self, num_samples):
+        '''self._pending followed by `num_samples` new source samples, in a scratch buffer'''
+        total = len(self._pending) + num_samples
+        if total > len(self._work):
+            self._work = np.zeros(total * 2, dtype=np.float32)
+        work = self._work[:total]
+        work[:len(self._pending)] = self._pending
+        if num_samples:
+            work[len(self._pending):] = self._source(num_samples)
+        return work
+
+    def fill(self, out):
+        '''Overwrites `out` (float32) with the next len(out) resampled samples. Returns `out`'''
+        num_samples = len(out)
+        if num_samples > len(self._ramp):
+            self._ramp = np.arange(1, num_samples + 1, dtype=np.float64) / num_samples
+            self._positions = np.zeros(num_samples)
+            self._indices = np.zeros(num_samples, dtype=np.intp)
+
+        # Step between output samples goes linearly from the last factor to the new one
+        positions = self._positions[:num_samples]
+        np.multiply(self._ramp[:num_samples], self.factor - self._last_factor, out=positions)
+        positions += self._last_factor
+        np.cumsum(positions, out=positions)
+        next_pos = self._pos + positions[-1]
+        positions[1:] = positions[:-1]
+        positions[0] = 0
+        positions += self._pos
+
+        # Interpolating needs the sample after each position, including the next block's first
+        work = self._fetch(max(int(next_pos) + 2 - len(self._pending), 0))
+        if self.factor == self._last_factor == 1.0 and self._pos == 0:
+            out[:] = work[:num_samples] # nothing to resample
+        else:
+            indices = self._indices[:num_samples]
+            np.copyto(indices, positions, casting='unsafe') # positions are positive, so this rounds down
+            positions -= indices # fraction of the way to the next sample
+            np.subtract(work[indices + 1], work[indices], out=out)
+            out *= positions
+            out += work[indices]
+
+        keep_from = int(next_pos)
+        self._pending = work[keep_from:].copy()
+        self._pos = next_pos - keep_from
+        self._last_factor = self.factor
+        return out
+
+class Spatialiser:
+    def __init__(self, source, pan=0.0, gain=1.0, doppler=1.0):
+        '''
+        Turns a mono source into interleaved stereo int16 with a pan, gain and Doppler factor that
+        can be changed between blocks (see set). gen_audio() can be passed to
+        AudioDevice.play_stream(..., channels=2).
+
+        source: function taking a number of samples and returning that many int16 samples, e.g. Engine.gen_audio
+        '''
+        self._resampler = Resampler(source)
+        self.set(pan, gain, doppler)
+        self._mono = np.zeros(0, dtype=np.float32)
+        self._scaled = np.zeros(0, dtype=np.float32)
+        self._out_buffer = np.zeros((0, 2), dtype=np.int16)
+
+    def set(self, pan=None, gain=None, doppler=None):
+        if pan is not None:
+            self.pan = pan
+        if gain is not None:
+            self.gain = gain
+        if doppler is not None:
+            self._resampler.factor = doppler
+
+    def gen_audio(self, num_frames):
+        '''
+        Return `num_frames` stereo frames as interleaved int16 samples (left, right, left, ...).
+        The samples are a view into an output buffer that is reused by the next call, copy them to keep them.
+        '''
+        if num_frames > len(self._out_buffer):
+            self._out_buffer = np.zeros((num_frames, 2), dtype=np.int16)
+            self._mono = np.zeros(num_frames, dtype=np.float32)
+            self._scaled = np.zeros(num_frames, dtype=np.float32)
+        out = self._out_buffer[:num_frames]
+        mono = self._resampler.fill(self._mono[:num_frames])
+
+        left, right = pan_gains(self.pan)
+        for channel, gain in enumerate((left, right)):
+            scaled = np.multiply(mono, np.float32(gain * self.gain), out=self._scaled[:num_frames])
+            if self.gain > 1:
+                np.clip(scaled, -cfg.max_16bit, cfg.max_16bit, out=scaled)
+            np.copyto(out[:, channel], scaled, casting='unsafe')
+        return out.reshape(-1)
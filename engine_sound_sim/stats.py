@@ -0,0 +1,133 @@
+'''
+Counters for the audio path: how long device callbacks take, underflows reported by PortAudio, how much
+audio is buffered and how many engine cycles are rendered. Kept in one float64 array, so they can live in
+shared memory and be read from another process (see AudioClient.stats).
+'''
+
+import bisect
+import csv
+import json
+import os
+import time
+import numpy as np
+
+# Upper edges of the callback duration histogram buckets, in milliseconds. The last bucket is everything slower
+CALLBACK_MS_BUCKETS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50)
+
+FIELDS = (
+    'callbacks', # device callbacks so far
+    'frames', # frames handed to the device
+    'underflows', # callbacks PortAudio flagged with an output underflow (the device ran dry)
+    'overflows', # callbacks flagged with an output overflow
+    'producer_underruns', # times an AudioProducer was short of pre-rendered audio
+    'queue_depth', # samples an AudioProducer has rendered ahead, at the last callback
+    'buffer_depth', # samples in the watched engine's _audio_buffer, at the last callback
+    'buffer_depth_max',
+    'cycles_rendered', # engine cycles rendered by the watched engine
+    'cycles_per_sec',
+    'callback_ms_total',
+    'callback_ms_max',
+    'elapsed', # seconds since the first callback
+)
+_FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+_FLOAT_FIELDS = {'cycles_per_sec', 'callback_ms_total', 'callback_ms_max', 'elapsed'}
+_HISTOGRAM = len(FIELDS)
+_SIZE = _HISTOGRAM + len(CALLBACK_MS_BUCKETS) + 1
+
+class AudioStats:
+    nbytes = _SIZE * 8 # size of the buffer to pass in, e.g. a block of shared memory
+
+    def __init__(self, buf=None):
+        '''
+        Written by AudioDevice.play_stream(..., stats=...) on the audio thread, readable from anywhere.
+
+        buf: float64 array (or buffer) of at least `nbytes` bytes to keep the counters in, defaults to a new one.
+          Passing a view of shared memory lets another process read them
+        '''
+        if buf is None:
+            buf = np.zeros(_SIZE)
+        self._values = np.ndarray((_SIZE,), dtype=np.float64, buffer=buf)
+        self._engine = None
+        self._producer = None
+        self._start = None
+
+    def __getattr__(self, name):
+        if name in _FIELD_INDEX:
+            value = float(self._values[_FIELD_INDEX[name]])
+            return value if name in _FLOAT_FIELDS else int(value)
+        raise AttributeError(name)
+
+    def watch(self, engine=None, producer=None):
+        '''Also track `engine`'s buffer depth and cycles rendered, and `producer`'s queue and underruns'''
+        if engine is not None:
+            self._engine = engine
+        if producer is not None:
+            self._producer = producer
+
+    def reset(self):
+        self._values[:] = 0
+        self._start = None
+
+    def record_callback(self, duration, frames, underflow=False, overflow=False):
+        '''Counts one device callback that took `duration` seconds to produce `frames` frames'''
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now - duration
+        values = self._values
+        duration_ms = duration * 1000
+        values[_FIELD_INDEX['callbacks']] += 1
+        values[_FIELD_INDEX['frames']] += frames
+        values[_FIELD_INDEX['underflows']] += bool(underflow)
+        values[_FIELD_INDEX['overflows']] += bool(overflow)
+        values[_FIELD_INDEX['callback_ms_total']] += duration_ms
+        if duration_ms > values[_FIELD_INDEX['callback_ms_max']]:
+            values[_FIELD_INDEX['callback_ms_max']] = duration_ms
+        values[_HISTOGRAM + bisect.bisect_left(CALLBACK_MS_BUCKETS, duration_ms)] += 1
+
+        elapsed = now - self._start
+        values[_FIELD_INDEX['elapsed']] = elapsed
+        if self._producer is not None:
+            values[_FIELD_INDEX['producer_underruns']] = self._producer.underruns
+            values[_FIELD_INDEX['queue_depth']] = self._producer.queued_samples
+        if self._engine is not None:
+            depth = self._engine.buffered_samples
+            values[_FIELD_INDEX['buffer_depth']] = depth
+            if depth > values[_FIELD_INDEX['buffer_depth_max']]:
+                values[_FIELD_INDEX['buffer_depth_max']] = depth
+            values[_FIELD_INDEX['cycles_rendered']] = self._engine.cycles_rendered
+            if elapsed > 0:
+                values[_FIELD_INDEX['cycles_per_sec']] = self._engine.cycles_rendered / elapsed
+
+    def histogram(self):
+        '''Callback durations as {bucket label: count}, e.g. '<=0.5ms' '''
+        labels = [f'<={edge}ms' for edge in CALLBACK_MS_BUCKETS] + [f'>{CALLBACK_MS_BUCKETS[-1]}ms']
+        return dict(zip(labels, self._values[_HISTOGRAM:].astype(int).tolist()))
+
+    def snapshot(self):
+        '''All the counters as a plain dict, with the histogram and mean callback time'''
+        snapshot = {name: getattr(self, name) for name in FIELDS}
+        snapshot['callback_ms_mean'] = snapshot['callback_ms_total'] / snapshot['callbacks'] if snapshot['callbacks'] \
+            else 0.0
+        snapshot['callback_ms_histogram'] = self.histogram()
+        return snapshot
+
+    def export(self, path):
+        '''
+        Writes a snapshot to `path`: a .json file is overwritten, a .csv file gets one row appended
+        per call (with a header the first time), so calling it periodically records a time series.
+        '''
+        snapshot = self.snapshot()
+        if str(path).endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+        elif str(path).endswith('.csv'):
+            histogram = snapshot.pop('callback_ms_histogram')
+            row = {'time': time.time(), **snapshot, **histogram}
+            new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+            with open(path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+        else:
+            raise ValueError(f'Can only export stats to .json or .csv files, not {path}')
@@ -4,7 +4,89 @@ from engine_sound_sim import cfg
 
 import math
 import numpy as np
-import random
+
+class Oscillator:
+    def __init__(self, waveform='sine', frequency=440, phase=0.0, sample_rate=None, seed=None):
+        '''
+        Phase-continuous oscillator that fills caller-supplied buffers in place, so a sound can be
+        generated a block at a time without allocating. Scratch space is kept between calls.
+
+        waveform: 'sine', 'saw' (rising), 'square', 'noise', or a wavetable: array holding one cycle of any
+          waveform, played back with linear interpolation
+        frequency: Hz
+        phase: starting point in the cycle, 0 to 1
+        sample_rate: defaults to cfg.sample_rate
+        seed: for 'noise'
+        '''
+        if isinstance(waveform, str):
+            assert waveform in ('sine', 'saw', 'square', 'noise'), \
+                'waveform not in (\'sine\', \'saw\', \'square\', \'noise\') or a wavetable, see docstring'
+            self._table = None
+        else:
+            table = np.asarray(waveform, dtype=np.float64)
+            assert table.ndim == 1 and len(table) > 1, 'wavetable should hold one cycle of samples'
+            self._table = np.append(table, table[0]) # wraps round, so the last sample can interpolate too
+            self._slopes = np.diff(self._table)
+            waveform = 'table'
+        self.waveform = waveform
+        self.frequency = frequency
+        self.phase = phase
+        self.sample_rate = sample_rate or cfg.sample_rate
+        self._rng = np.random.default_rng(seed)
+
+        self._ramp = np.zeros(0) # 0, 1, 2 ... for working out the phase of every sample
+        self._scratch = np.zeros(0)
+        self._indices = np.zeros(0, dtype=np.intp)
+
+    def _phases(self, num_samples):
+        '''Phase (0 to 1) of the next `num_samples` samples, in a scratch buffer. Advances the oscillator'''
+        if num_samples > len(self._ramp):
+            self._ramp = np.arange(num_samples, dtype=np.float64)
+            self._scratch = np.zeros(num_samples)
+            self._indices = np.zeros(num_samples, dtype=np.intp)
+
+        step = self.frequency / self.sample_rate
+        phases = self._scratch[:num_samples]
+        np.multiply(self._ramp[:num_samples], step, out=phases)
+        phases += self.phase
+        np.mod(phases, 1, out=phases)
+        self.phase = (self.phase + num_samples * step) % 1
+        return phases
+
+    def fill(self, out):
+        '''Overwrites `out` (float32 or float64) with the next len(out) samples, between -1 and 1. Returns `out`'''
+        num_samples = len(out)
+        if self.waveform == 'noise':
+            self._rng.random(dtype=out.dtype, out=out)
+            out *= 2
+            out -= 1
+            return out
+
+        phases = self._phases(num_samples)
+        if self.waveform == 'sine':
+            phases *= 2 * np.pi
+            np.sin(phases, out=out)
+        elif self.waveform == 'saw':
+            phases *= 2
+            np.subtract(phases, 1, out=out)
+        elif self.waveform == 'square':
+            np.subtract(0.5, phases, out=phases)
+            np.sign(phases, out=out)
+        else:
+            # Linear interpolation between the two table samples either side of each phase
+            phases *= len(self._table) - 1
+            indices = self._indices[:num_samples]
+            np.copyto(indices, phases, casting='unsafe') # phases are positive, so this rounds down
+            phases -= indices # fraction of the way to the next table sample
+            out[:] = self._table[indices] + self._slopes[indices] * phases
+        return out
+
+    def generate(self, num_samples, dtype=np.float32):
+        '''Next `num_samples` samples in a new buffer'''
+        return self.fill(np.empty(num_samples, dtype=dtype))
+
+def _elements(duration):
+    return math.ceil(duration * cfg.sample_rate)
 
 def sine_wave_note(frequency, duration):
     '''
@@ -12,38 +94,33 @@ def sine_wave_note(frequency, duration):
     frequency: Hz
     duration: seconds
     '''
-    elements = math.ceil(duration * cfg.sample_rate)
-    timesteps = np.linspace(start=0, stop=duration, num=elements, endpoint=False)
-    return np.sin(frequency * timesteps * 2 * np.pi)
+    return Oscillator('sine', frequency).generate(_elements(duration), dtype=np.float64)
 
 def sawtooth_wave_note(frequency, duration):
     '''
-    Creates audio buffer representing a sine-wave
+    Creates audio buffer representing a sawtooth-wave, falling from frequency*2*pi to 0
+    at frequency*2*pi Hz
     frequency: Hz
     duration: seconds
     '''
-    elements = math.ceil(duration * cfg.sample_rate)
-    timesteps = np.linspace(start=0, stop=duration, num=elements, endpoint=False)
-    print(timesteps)
-    timesteps = timesteps.tolist()
-    timesteps = [1-((x * frequency * 2 * np.pi)%1) for x in timesteps]
-    timesteps = np.array(timesteps)
-    return frequency * timesteps * 2 * np.pi
+    buf = Oscillator('saw', frequency * 2 * np.pi).generate(_elements(duration), dtype=np.float64)
+    # rising -1 to 1 saw -> falling from frequency*2*pi to 0
+    buf -= 1
+    buf *= -frequency * np.pi
+    return buf
 
 def random_wave_note(frequency, duration):
     '''
-    Creates audio buffer representing a sine-wave
-    frequency: Hz
+    Creates audio buffer of white noise between -1 and 1
+    frequency: unused, noise has no pitch
     duration: seconds
     '''
-    elements = math.ceil(duration * cfg.sample_rate)
-    timesteps = np.linspace(start=0, stop=duration, num=elements, endpoint=False)
-    return np.array([float(x%1)-1 for x in range(len(timesteps))])
+    return Oscillator('noise').generate(_elements(duration), dtype=np.float64)
 
 def silence(duration):
     '''
     Creates audio buffer representing silence
     duration: seconds
     '''
-    elements = math.ceil(duration * cfg.sample_rate)
+    elements = _elements(duration)
     return np.zeros(elements)
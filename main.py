@@ -2,14 +2,18 @@
 Origin from pyarcade examples, scroll around screen
 """
 
-import random
 import arcade
-import math
+import os
+import PIL.Image
 import time
 from pyglet.math import Vec2
 from pynput import keyboard
-import engine_sound_sim.engine_factory
-from engine_sound_sim.audio_device import AudioDevice
+from engine_sound_sim.audio_server import AudioServer
+from engine_sound_sim import spatial
+import simulation
+import collision
+import track
+import world
 from multiprocessing import Process
 import threading
 
@@ -26,15 +30,27 @@ VIEWPORT_MARGIN = 300
 # How fast the camera pans to the player. 1.0 is instant.
 CAMERA_SPEED = 0.3
 
-# How fast the car moves
-BASE_RPM = 750
-STEERING_COEF = 550
-BRAKE_SPEED = 0.2
-POWER_MAX = 40
-    # POWER_MAX = 40 Top speed is 35 (with 0.9993 resistance) -> 315km/h
+# How fast the car moves: see simulation.py
 RUNNING = True
 
+# Speed of sound in game units (speed is in pixels per update, speed*9 is km/h), for Doppler
+SPEED_OF_SOUND = 1235 / 9
+
+# The track, drawn at TRACK_SCALE times the image size with its bottom left corner at (0, 0)
+TRACK_IMAGE = "img/monzaoutline.png"
+TRACK_SCALE = 2
+START_POSITION = (5000, 520)  # on the main straight
+# Speed kept per step with the whole car off the track
+GRASS_DRAG = 0.98
+
+# The world is loaded and drawn in CHUNK_SIZE squares around the camera, at most MAX_CHUNKS at a time,
+# and chunks coming into view are loaded ahead of time, at most CHUNK_LOADS_PER_FRAME a frame
+CHUNK_SIZE = 1024
+MAX_CHUNKS = 24
+CHUNK_LOADS_PER_FRAME = 1
+
 # 1 block is 64*64 pixels
+BLOCK_SIZE = 64
 blocks = [
     (0,0),
     (64,64)
@@ -67,15 +83,24 @@ class MyGame(arcade.Window):
         """
         super().__init__(width, height, title, resizable=True)
 
-        # Sprite lists
+        # Sprite lists, the track and walls are in the world's chunks
+        self.world = None
         self.player_list = None
-        self.wall_list = None
 
-        # Set up the player
+        # The track image, cut up into a texture per chunk, and which pixels are track and which are
+        # inside its outline (the edge of the map)
+        self.track_image = None
+        self.track_mask = None
+        self.ground_mask = None
+
+        # Set up the player, drawn from the car's simulated state
         self.player_sprite = None
+        self.car = None
+        self.timestep = None
 
-        # Physics engine so we don't run into walls.
-        self.physics_engine = None
+        # Wall positions in a grid, so we don't run into walls without checking every one of them
+        self.wall_grid = None
+        self.car_size = None
 
         # Track the current state of what key is pressed
         self.left_pressed = False
@@ -91,93 +116,56 @@ class MyGame(arcade.Window):
         # We scroll the 'sprite world' but not the GUI.
         self.camera_sprites = arcade.Camera(DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_HEIGHT)
         self.camera_gui = arcade.Camera(DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_HEIGHT)
+        self.listener_position = None  # centre of the sprite camera last update, for Doppler
 
         # Create sound management variables
-        self.engine = None
+        self.audio = None
         self.lock = None
         self.blockingInputThread = None
 
-    def setup(self):
+    def setup(self, audio):
         """Set up the game and initialize the variables."""
 
         # Sprite lists
         self.player_list = arcade.SpriteList()
-        self.wall_list = arcade.SpriteList()
+
+        # Set up the track, the masks are cached next to the image after the first run
+        with PIL.Image.open(TRACK_IMAGE) as image:
+            self.track_image = image.convert("RGBA")
+        self.track_mask = track.Bitmask.load(
+            TRACK_IMAGE, TRACK_SCALE, cache=TRACK_IMAGE.replace(".png", ".track.npz")
+        )
+        self.ground_mask = track.Bitmask.load(
+            TRACK_IMAGE, TRACK_SCALE, max_brightness=256, cache=TRACK_IMAGE.replace(".png", ".ground.npz")
+        )
 
         # Set up the player
         self.player_sprite = arcade.Sprite("./img/red_car/straight.png", scale=0.4)
-        self.player_sprite.center_x = 0
-        self.player_sprite.center_y = 0
-
-        # T1 (interacting with the player)
-        self.player_sprite.throttle = 0
-        self.player_sprite.brake = 0
-        self.player_sprite.steering = 0
-        self.player_sprite.gear = 0
+        self.player_sprite.center_x, self.player_sprite.center_y = START_POSITION
 
-        # T2 variables (engine)
-        self.player_sprite.power = 0
-        self.player_sprite.torque = 0
-
-        # T3 variables (connecting engine to physics and sound)
-        self.player_sprite.rpm = 750
-
-        # T4 variables (interacting with the physics engine)
-        self.player_sprite.angle = 0
-        self.player_sprite.speed = 0
+        # Throttle, brake, steering, gears, engine and movement, see simulation.py
+        self.car = simulation.CarState(self.player_sprite.center_x, self.player_sprite.center_y)
+        self.timestep = simulation.FixedTimestep()
 
         self.player_list.append(self.player_sprite)
 
-        # -- Set up several columns of walls
-        for x in range(200, 5000, 210):
-            for y in range(0, 5000, 64):
-                # Randomly skip a box so the player can find a way through
-                if random.randrange(5) > 0:
-                    wall = arcade.Sprite(
-                        ":resources:images/tiles/grassCenter.png", SPRITE_SCALING
-                    )
-                    wall.center_x = x
-                    wall.center_y = y
-                    self.wall_list.append(wall)
-        
-        for i in blocks:
-            wall = arcade.Sprite(
-                ":resources:images/tiles/grassCenter.png", SPRITE_SCALING
-            )
-            wall.center_x = i[0]
-            wall.center_y = i[1]
-            self.wall_list.append(wall)
-
-        self.physics_engine = arcade.PhysicsEngineSimple(
-            self.player_sprite, self.wall_list
+        # Walls are only turned into sprites when their chunk is loaded
+        self.wall_grid = collision.WallGrid(
+            [(x - BLOCK_SIZE / 2, y - BLOCK_SIZE / 2, x + BLOCK_SIZE / 2, y + BLOCK_SIZE / 2) for x, y in blocks]
         )
+        self.world = world.ChunkedWorld(self.load_chunk, CHUNK_SIZE, MAX_CHUNKS, max_loads=CHUNK_LOADS_PER_FRAME)
+        self.car_size = (self.player_sprite.width, self.player_sprite.height)  # at angle 0
 
         # Set the background color
         arcade.set_background_color(arcade.color.AMAZON)
 
-        # Create engine sound engine
-        self.engine = engine_sound_sim.engine_factory.formula_one()
-        # self.engine = engine_sound_sim.engine_factory.v_four_90_deg()
-        # self.engine = engine_sound_sim.engine_factory.w_16()
-        # self.engine = engine_sound_sim.engine_factory.v_8_LS()
-        # self.engine = engine_sound_sim.engine_factory.inline_5_crossplane()
-        # self.engine = engine_sound_sim.engine_factory.inline_6()
-        # self.engine = engine_sound_sim.engine_factory.boxer_4_crossplane_custom([1, 1, 0, 0])  # (rando := random.randrange(360)))
-        # self.engine = engine_sound_sim.engine_factory.inline_4_1_spark_plug_disconnected()
-        # self.engine = engine_sound_sim.engine_factory.inline_4()
-        # self.engine = engine_sound_sim.engine_factory.boxer_4_half()
-        # self.engine = engine_sound_sim.engine_factory.random()
-        # self.engine = engine_sound_sim.engine_factory.fake_rotary_2rotor()
-        # self.engine = engine_sound_sim.engine_factory.V_12()
+        # Engine sound is played by the audio server process, we only send it the RPM
+        self.audio = audio
 
         self.lock = threading.Lock()
         self.blockingInputThread = _BlockingInputThread(self.lock)
         self.blockingInputThread.start()
 
-        # Connect engine to audio device
-        self.audio_device = AudioDevice()
-        self.stream = self.audio_device.play_stream(self.engine.gen_audio)
-
     def on_draw(self):
         """Render the screen."""
 
@@ -188,7 +176,7 @@ class MyGame(arcade.Window):
         self.camera_sprites.use()
 
         # Draw all the sprites.
-        self.wall_list.draw()
+        self.world.draw()
         self.player_list.draw()
 
         # Select the (unscrolled) camera for our GUI
@@ -200,13 +188,13 @@ class MyGame(arcade.Window):
         )
         text = (
             f"Coords: ({self.camera_sprites.position[0]:5.1f}, {self.camera_sprites.position[1]:5.1f}) | "
-            f"Speed: {self.player_sprite.speed*9:5.1f}km/h | "
-            f"Gear: {self.player_sprite.gear if self.player_sprite.gear > 0 else 'N' if self.player_sprite.gear == 0 else f'R{abs(self.player_sprite.gear)}'} | "
-            #f"Throttle: {self.player_sprite.throttle} | "
-            #f"Brake: {self.player_sprite.brake} | "
-            #f"Angle: {self.player_sprite.angle:5.1f} | "
-            #f"Steering: {self.player_sprite.steering} | "
-            f"RPM: {abs(self.player_sprite.rpm):0.0f}"
+            f"Speed: {self.car.speed*9:5.1f}km/h | "
+            f"Gear: {self.car.gear if self.car.gear > 0 else 'N' if self.car.gear == 0 else f'R{abs(self.car.gear)}'} | "
+            #f"Throttle: {self.car.throttle} | "
+            #f"Brake: {self.car.brake} | "
+            #f"Angle: {self.car.angle:5.1f} | "
+            #f"Steering: {self.car.steering} | "
+            f"RPM: {abs(self.car.rpm):0.0f}"
         )
 
         arcade.draw_text(text, 10, 10, arcade.color.BLACK, 20)
@@ -224,10 +212,10 @@ class MyGame(arcade.Window):
             self.right_pressed = True
         elif key == arcade.key.Q:
             self.shift_down_pressed = True
-            self.player_sprite.gear -= 1 if self.player_sprite.gear > 0 or self.player_sprite.speed < 0.5 and self.player_sprite.gear > -1 else 0
+            simulation.shift(self.car, -1)
         elif key == arcade.key.E:
             self.shift_up_pressed = True
-            self.player_sprite.gear += 1 if self.player_sprite.gear < 0 or self.player_sprite.speed > -0.5 and self.player_sprite.gear < 7 else 0
+            simulation.shift(self.car, 1)
 
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key."""
@@ -248,97 +236,117 @@ class MyGame(arcade.Window):
     def on_update(self, delta_time):
         """Movement and game logic"""
 
-        # Throttle input
-        self.player_sprite.throttle = 1 if self.up_pressed else 0
-
-        # Brake input
-        self.player_sprite.brake = 1 if self.down_pressed else 0
-
         # Steering input
         if self.left_pressed and not self.right_pressed:
-            self.player_sprite.steering = 1
+            steering = 1
         elif self.right_pressed and not self.left_pressed:
-            self.player_sprite.steering = -1
+            steering = -1
         else:
-            self.player_sprite.steering = 0
-
-        # Update steering
-        self.player_sprite.angle += (
-            (
-                self.player_sprite.steering
-                / (
-                    abs(self.player_sprite.speed) / 3 * 40 / STEERING_COEF
-                )
-            )
-            if abs(self.player_sprite.steering * self.player_sprite.speed * 0.8) > 5
-            else self.player_sprite.steering * self.player_sprite.speed * 0.8
+            steering = 0
+        inputs = simulation.Inputs(
+            throttle=1 if self.up_pressed else 0,
+            brake=1 if self.down_pressed else 0,
+            steering=steering,
         )
 
-        # Update sound based on throttle & gear
-        self.engine.specific_rpm(self.player_sprite.rpm)
+        # Drive the car in fixed steps, however long the frame took
+        steps = self.timestep.advance(delta_time)
+        for _ in steps:
+            simulation.step(self.car, inputs)
 
-        # Update T2 and T3 variables
-        self.player_sprite.torque = POWER_MAX * (1 - (self.player_sprite.gear if self.player_sprite.gear != 0 else 1) / 8)
-        self.player_sprite.power = POWER_MAX * ((self.player_sprite.gear if self.player_sprite.gear != 0 else 1) / 8)
-        if self.player_sprite.gear:
-            self.player_sprite.rpm = self.player_sprite.speed / (self.player_sprite.power+0.000001) * 12500 if abs(self.player_sprite.speed) > 0 else 750
-        else:
-            if self.player_sprite.throttle and self.player_sprite.rpm < 12500:
-                self.player_sprite.rpm += 800 if self.player_sprite.rpm < 12000 else 300 if self.player_sprite.rpm < 13000 else 0
-            if self.player_sprite.rpm >= 750:
-                self.player_sprite.rpm -= 150
-            else:
-                self.player_sprite.rpm = 750
-
-        # Update speed based on torque, power and throttle:
-        if self.player_sprite.throttle and self.player_sprite.gear:
-            self.player_sprite.speed += self.player_sprite.torque * 0.005
-        
-        # Update speed based on power limiter
-        if self.player_sprite.speed > self.player_sprite.power and self.player_sprite.gear:
-            self.player_sprite.speed -= (self.player_sprite.speed - self.player_sprite.power) / (3 - self.player_sprite.throttle)
-
-        # Update speed based on resistance
-        self.player_sprite.speed *= 0.998
-
-        # Update speed based on braking
-        if self.player_sprite.brake:
-            BRAKE_COEF = BRAKE_SPEED if abs(self.player_sprite.speed) > BRAKE_SPEED * 1.1 else abs(self.player_sprite.speed)
-            if self.player_sprite.speed > 0:
-                self.player_sprite.speed -= BRAKE_COEF
-            elif self.player_sprite.speed < 0:
-                self.player_sprite.speed += BRAKE_COEF
-
-        # Update player position based on speed and angle
-        self.player_sprite.change_x = (
-            self.player_sprite.speed
-        ) * math.cos(math.radians(self.player_sprite.angle))
-        self.player_sprite.change_y = (
-            self.player_sprite.speed
-        ) * math.sin(math.radians(self.player_sprite.angle))
-        self.position = arcade.rotate_point(
-            self.player_sprite.center_x,
-            self.player_sprite.center_y,
+        # Move the sprite to where the car got to, stopping at walls
+        half_width, half_height = collision.half_extent(*self.car_size, self.car.angle)
+        self.car.x, self.car.y = self.wall_grid.move(
             self.player_sprite.center_x,
             self.player_sprite.center_y,
-            self.player_sprite.angle,
+            self.car.x - self.player_sprite.center_x,
+            self.car.y - self.player_sprite.center_y,
+            half_width,
+            half_height,
         )
 
-        # Update angle to keep within bounds (0-360deg)
-        self.player_sprite.angle += (
-            -360
-            if self.player_sprite.angle > 360
-            else +360
-            if self.player_sprite.angle < 0
-            else 0
-        )
+        # The edge of the map stops the car like a wall, and off the track the grass slows it down
+        corners = track.corners(self.car.x, self.car.y, self.car.angle, *self.car_size)
+        if not self.ground_mask.contains(*corners).all():
+            self.car.x, self.car.y = self.player_sprite.center_x, self.player_sprite.center_y
+            corners = track.corners(self.car.x, self.car.y, self.car.angle, *self.car_size)
+        off_track = 1 - self.track_mask.contains(*corners).mean()
+        if off_track:
+            self.car.speed *= GRASS_DRAG ** (len(steps) * off_track)
+
+        self.player_sprite.center_x = self.car.x
+        self.player_sprite.center_y = self.car.y
+        self.player_sprite.angle = self.car.angle
 
-        # Call update on all sprites (The sprites don't do much in this
-        # example though.)
-        self.physics_engine.update()
+        # Update sound based on throttle & gear, and where the car is on screen
+        self.audio.set_rpm(self.car.rpm)
+        self.update_spatial_audio()
 
-        # Scroll the screen to the player
+        # Scroll the screen to the player, and load what's around it
         self.scroll_to_player()
+        self.world.update(
+            self.camera_sprites.position[0], self.camera_sprites.position[1], self.width, self.height
+        )
+
+    def load_chunk(self, left, bottom, right, top):
+        """
+        Sprites for the part of the world from (left, bottom) to (right, top): its piece of the track
+        image, and the walls overlapping it. The track piece is a texture of its own, not added to arcade's
+        texture cache, and each chunk has its own texture atlas, so both are freed along with the chunk
+        when it's evicted.
+        """
+        chunk = arcade.SpriteList(atlas=arcade.TextureAtlas((CHUNK_SIZE, CHUNK_SIZE)))
+
+        # The piece of the track image under the chunk, in image pixels from its top left corner
+        image_left = max(0, int(left / TRACK_SCALE))
+        image_right = min(self.track_mask.width, int(right / TRACK_SCALE))
+        image_top = max(0, self.track_mask.height - int(top / TRACK_SCALE))
+        image_bottom = min(self.track_mask.height, self.track_mask.height - int(bottom / TRACK_SCALE))
+        if image_right > image_left and image_bottom > image_top:
+            texture = arcade.Texture(
+                f"track {image_left} {image_top}",
+                image=self.track_image.crop((image_left, image_top, image_right, image_bottom)),
+                hit_box_algorithm="None",
+            )
+            tile = arcade.Sprite(texture=texture, scale=TRACK_SCALE, hit_box_algorithm="None")
+            tile.left = image_left * TRACK_SCALE
+            tile.bottom = (self.track_mask.height - image_bottom) * TRACK_SCALE
+            chunk.append(tile)
+
+        # Walls on the edge of the chunk are in both chunks, so they're drawn as soon as either is in view
+        for i in self.wall_grid.query(left, bottom, right, top):
+            wall_left, wall_bottom, wall_right, wall_top = self.wall_grid.rects[i]
+            wall = arcade.Sprite(
+                ":resources:images/tiles/grassCenter.png", SPRITE_SCALING
+            )
+            wall.center_x = (wall_left + wall_right) / 2
+            wall.center_y = (wall_bottom + wall_top) / 2
+            chunk.append(wall)
+
+        return chunk if len(chunk) else None
+
+    def update_spatial_audio(self):
+        """
+        Pan the engine sound towards the side of the screen the car is on, and Doppler shift it
+        as the car moves towards or away from the camera.
+        """
+        listener_position = (
+            self.camera_sprites.position[0] + self.width / 2,
+            self.camera_sprites.position[1] + self.height / 2,
+        )
+        previous = self.listener_position or listener_position
+        listener_velocity = (listener_position[0] - previous[0], listener_position[1] - previous[1])
+        self.listener_position = listener_position
+
+        _, pan, doppler = spatial.relative(
+            (self.player_sprite.center_x, self.player_sprite.center_y),
+            (self.car.change_x, self.car.change_y),
+            listener_position,
+            listener_velocity,
+            ref_distance=self.width / 2,  # pan is fully left or right at the edge of the screen
+            speed_of_sound=SPEED_OF_SOUND,
+        )
+        self.audio.set_spatial(float(pan), float(doppler))
 
     def scroll_to_player(self):
         """
@@ -363,17 +371,31 @@ class MyGame(arcade.Window):
         self.camera_gui.resize(int(width), int(height))
 
 
-def game_engine_processor():
+def game_engine_processor(audio):
     window = MyGame(DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_HEIGHT, SCREEN_TITLE)
-    window.setup()
+    window.setup(audio)
     arcade.run()
+    audio.close()
 
 def main():
     """Main function"""
-    p1 = Process(target=game_engine_processor) 
+    # Engine sound runs in its own process so the game can't starve the audio callback
+    # engine_name is any engine_factory preset (engine_factory.names()), e.g. "w_16", "v_8_LS", "inline_6", "V_12"
+    # AUDIO_BACKEND=null (or =some_file.wav) runs without a sound card, see engine_sound_sim/audio_backend.py
+    audio_server = AudioServer(
+        engine_name="formula_one", ahead_ms=40, channels=2, backend=os.environ.get("AUDIO_BACKEND")
+    )
+    audio_server.start()
+
+    p1 = Process(target=game_engine_processor, args=(audio_server.client(),))
     p1.start()
-    # Might incorporate multithreading later
-    # For now it's leftover from implementing engine sounds
+    try:
+        p1.join()  # until the window is closed
+    except KeyboardInterrupt:
+        p1.terminate()
+        p1.join()
+    finally:
+        audio_server.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,255 @@
+'''
+Car physics without a window: throttle, brake, steering and gears in, RPM, speed, heading and position out.
+Runs with a fixed timestep, so a car behaves the same at any frame rate, and needs neither arcade nor a
+display, for replays, AI training and checking laps on a server. MyGame steps a CarState and draws the
+sprite from it. Cars and step_cars() do the same for a whole grid of cars at once, with NumPy.
+
+The handling was tuned a frame at a time at 60 FPS, DT is that frame. Other timesteps scale every
+per-frame change by dt / DT, so keep them close to DT.
+'''
+
+import math
+from collections import namedtuple
+import numpy as np
+
+DT = 1 / 60 # seconds per step
+
+BASE_RPM = 750
+MAX_RPM = 12500
+STEERING_COEF = 550
+BRAKE_SPEED = 0.2
+POWER_MAX = 40
+    # POWER_MAX = 40 Top speed is 35 (with 0.9993 resistance) -> 315km/h
+DRAG = 0.998 # speed kept per step
+TOP_GEAR = 7
+
+# throttle and brake 0 or 1, steering 1 (left), 0 or -1 (right), shift -1 (down), 0 or 1 (up)
+Inputs = namedtuple('Inputs', ['throttle', 'brake', 'steering', 'shift'], defaults=[0, 0, 0, 0])
+
+class CarState:
+    __slots__ = ('x', 'y', 'angle', 'speed', 'change_x', 'change_y', 'gear', 'rpm',
+                 'throttle', 'brake', 'steering', 'torque', 'power')
+
+    def __init__(self, x=0.0, y=0.0, angle=0.0):
+        '''
+        Everything step() reads and writes about one car. Positions are in pixels, speeds in pixels per
+        step (speed*9 is km/h), angles in degrees anticlockwise from the x axis. Gear 0 is neutral,
+        negative gears are reverse.
+        '''
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.speed = 0.0
+        self.change_x = 0.0 # velocity in pixels per step, along x and y
+        self.change_y = 0.0
+        self.gear = 0
+        self.rpm = BASE_RPM
+
+        # Last inputs, and the gear's torque and power they were applied with
+        self.throttle = 0
+        self.brake = 0
+        self.steering = 0
+        self.torque = 0.0
+        self.power = 0.0
+
+    def copy(self):
+        state = CarState.__new__(CarState)
+        for name in CarState.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+def shift(state, direction):
+    '''Changes gear up (1) or down (-1) if the car's speed allows it'''
+    if direction > 0 and (state.gear < 0 or state.speed > -0.5 and state.gear < TOP_GEAR):
+        state.gear += 1
+    elif direction < 0 and (state.gear > 0 or state.speed < 0.5 and state.gear > -1):
+        state.gear -= 1
+
+def step(state, inputs, dt=DT):
+    '''Advances `state` by `dt` seconds of driving with `inputs`, in place'''
+    k = dt / DT
+    throttle, brake, steering, gear_change = inputs
+    if gear_change:
+        shift(state, gear_change)
+    state.throttle = throttle
+    state.brake = brake
+    state.steering = steering
+    speed = state.speed
+    gear = state.gear
+
+    # Steering turns the car less the faster it goes
+    turn = steering * speed * 0.8
+    if abs(turn) > 5:
+        turn = steering / (abs(speed) / 3 * 40 / STEERING_COEF)
+    angle = state.angle + turn * k
+
+    # The gear trades torque (acceleration) for power (top speed)
+    ratio = (gear if gear != 0 else 1) / 8
+    torque = state.torque = POWER_MAX * (1 - ratio)
+    power = state.power = POWER_MAX * ratio
+
+    # RPM follows the wheels in gear, and the throttle in neutral
+    if gear:
+        state.rpm = speed / (power + 0.000001) * MAX_RPM if abs(speed) > 0 else BASE_RPM
+    else:
+        rpm = state.rpm
+        if throttle and rpm < MAX_RPM:
+            rpm += (800 if rpm < 12000 else 300) * k
+        state.rpm = rpm - 150 * k if rpm >= BASE_RPM else BASE_RPM
+
+    if throttle and gear:
+        speed += torque * 0.005 * k
+    # Above the gear's top speed, fall back towards it
+    if speed > power and gear:
+        speed -= (speed - power) / (3 - throttle) * k
+    speed *= DRAG if k == 1 else DRAG ** k
+    if brake:
+        brake_speed = BRAKE_SPEED * k
+        brake_speed = brake_speed if abs(speed) > brake_speed * 1.1 else abs(speed)
+        if speed > 0:
+            speed -= brake_speed
+        elif speed < 0:
+            speed += brake_speed
+    state.speed = speed
+
+    radians = math.radians(angle)
+    change_x = state.change_x = speed * math.cos(radians)
+    change_y = state.change_y = speed * math.sin(radians)
+    state.x += change_x * k
+    state.y += change_y * k
+    state.angle = angle - 360 if angle > 360 else angle + 360 if angle < 0 else angle
+
+def run(state, inputs, dt=DT):
+    '''Steps `state` once for each of `inputs` (e.g. a recorded replay), in place, and returns it'''
+    for step_inputs in inputs:
+        step(state, step_inputs, dt)
+    return state
+
+class FixedTimestep:
+    def __init__(self, dt=DT):
+        '''
+        Turns variable frame times into whole steps of `dt`, e.g. for MyGame.on_update:
+        `for _ in timestep.advance(delta_time): step(state, inputs)`. Time left over is kept for the next frame.
+        '''
+        self.dt = dt
+        self.accumulator = 0.0
+
+    def advance(self, elapsed, max_steps=10):
+        '''
+        Number of steps to run for `elapsed` more seconds, as a range. At most `max_steps`, so a long
+        stall (e.g. dragging the window) doesn't have to be caught up on all at once.
+        '''
+        self.accumulator += elapsed
+        steps = int(self.accumulator / self.dt)
+        if steps > max_steps:
+            steps = max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.dt
+        return range(steps)
+
+class Cars:
+    def __init__(self, n=0, x=0.0, y=0.0, angle=0.0):
+        '''
+        The state of many cars as one NumPy array per CarState field (e.g. cars.speed[i] is car i's speed),
+        for step_cars() to advance a whole grid of AI and remote cars in one call.
+        x, y, angle: starting position of every car, a number or an array of n
+        '''
+        self.x = np.zeros(n) + x
+        self.y = np.zeros(n) + y
+        self.angle = np.zeros(n) + angle
+        self.speed = np.zeros(n)
+        self.change_x = np.zeros(n)
+        self.change_y = np.zeros(n)
+        self.gear = np.zeros(n, dtype=np.int64)
+        self.rpm = np.full(n, float(BASE_RPM))
+        self.throttle = np.zeros(n)
+        self.brake = np.zeros(n)
+        self.steering = np.zeros(n)
+        self.torque = np.zeros(n)
+        self.power = np.zeros(n)
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, state=None):
+        '''Adds a car, a new one or a copy of CarState `state`, returns its index'''
+        state = state if state is not None else CarState()
+        for name in CarState.__slots__:
+            setattr(self, name, np.append(getattr(self, name), getattr(state, name)))
+        return len(self) - 1
+
+    def state(self, i):
+        '''Car `i` as a CarState, e.g. to draw it or step it on its own'''
+        state = CarState.__new__(CarState)
+        for name in CarState.__slots__:
+            setattr(state, name, getattr(self, name)[i].item())
+        return state
+
+    def set_state(self, i, state):
+        for name in CarState.__slots__:
+            getattr(self, name)[i] = getattr(state, name)
+
+def step_cars(cars, inputs, dt=DT):
+    '''
+    Advances every car in `cars` by `dt` seconds, in place, the same way step() advances one.
+    The fields of `inputs` are arrays with one value per car, or single values for all of them.
+    '''
+    k = dt / DT
+    throttle, brake, steering, gear_change = inputs
+    speed = cars.speed
+    gear = cars.gear
+    if np.any(gear_change):
+        gear += (gear_change > 0) & ((gear < 0) | (speed > -0.5) & (gear < TOP_GEAR))
+        gear -= (gear_change < 0) & ((gear > 0) | (speed < 0.5) & (gear > -1))
+    cars.throttle[:] = throttle
+    cars.brake[:] = brake
+    cars.steering[:] = steering
+    throttle = cars.throttle
+    steering = cars.steering
+    in_gear = gear != 0
+    # Changes that only apply to some cars are multiplied by a mask of them, rather than selected with
+    # np.where, which is slower and gives the same result (x * 1 and x + 0 are exact)
+    neutral = ~in_gear
+
+    # Steering turns the car less the faster it goes
+    turn = steering * speed * 0.8
+    fast = np.abs(turn) > 5
+    if fast.any():
+        turn[fast] = steering[fast] / (np.abs(speed[fast]) / 3 * 40 / STEERING_COEF)
+    angle = cars.angle
+    angle += turn * k
+
+    # The gear trades torque (acceleration) for power (top speed)
+    ratio = (gear + neutral) / 8
+    torque = cars.torque
+    power = cars.power
+    np.multiply(POWER_MAX, 1 - ratio, out=torque)
+    np.multiply(POWER_MAX, ratio, out=power)
+
+    # RPM follows the wheels in gear, and the throttle in neutral
+    rpm = cars.rpm
+    revving = neutral & (throttle != 0) & (rpm < MAX_RPM)
+    if revving.any():
+        rpm += revving * np.where(rpm < 12000, 800 * k, 300 * k)
+    rpm[:] = np.where(rpm >= BASE_RPM, rpm - 150 * k, BASE_RPM)
+    if in_gear.any():
+        rpm[in_gear] = np.where(speed != 0, speed / (power + 0.000001) * MAX_RPM, BASE_RPM)[in_gear]
+
+    speed += (in_gear * throttle) * (torque * (0.005 * k))
+    # Above the gear's top speed, fall back towards it
+    speed -= ((speed > power) & in_gear) * ((speed - power) / (3 - throttle) * k)
+    speed *= DRAG if k == 1 else DRAG ** k
+    if np.any(brake):
+        brake_speed = BRAKE_SPEED * k
+        abs_speed = np.abs(speed)
+        brake_speed = np.where(abs_speed > brake_speed * 1.1, brake_speed, abs_speed)
+        speed -= (cars.brake != 0) * np.sign(speed) * brake_speed
+
+    radians = np.radians(angle)
+    np.multiply(speed, np.cos(radians), out=cars.change_x)
+    np.multiply(speed, np.sin(radians), out=cars.change_y)
+    cars.x += cars.change_x * k
+    cars.y += cars.change_y * k
+    angle[angle > 360] -= 360
+    angle[angle < 0] += 360
@@ -0,0 +1,53 @@
+'''
+AudioProducer's worker thread, without a sound card.
+Run from the repository root: python -m pytest
+'''
+
+import time
+
+import numpy as np
+
+from engine_sound_sim.audio_device import AudioProducer
+
+def _wait_for(condition, timeout=5):
+    end = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < end:
+        time.sleep(0.001)
+    return condition()
+
+def test_keeps_queue_filled():
+    producer = AudioProducer(lambda num_frames: np.ones(num_frames, dtype=np.int16), ahead_ms=20, block_size=64,
+                             sample_rate=8000)
+    producer.start()
+    try:
+        for _ in range(200):
+            assert _wait_for(lambda: producer.queued_samples >= producer.ahead_samples)
+            assert np.all(producer.read(32) == 1)
+        assert producer.underruns == 0
+        assert producer.error is None
+    finally:
+        producer.stop()
+
+def test_callback_error_stops_cleanly(capsys):
+    calls = 0
+    def callback(num_frames):
+        nonlocal calls
+        calls += 1
+        if calls > 3:
+            raise RuntimeError('render failed')
+        return np.ones(num_frames, dtype=np.int16)
+
+    producer = AudioProducer(callback, ahead_ms=10, block_size=64, sample_rate=8000)
+    producer.start()
+    thread = producer._thread
+    assert _wait_for(lambda: producer.read(64) is not None and not thread.is_alive())
+    assert isinstance(producer.error, RuntimeError)
+    assert 'render failed' in capsys.readouterr().err
+
+    # The stream carries on with silence once what was rendered has played, counted as underruns
+    while producer.queued_samples:
+        producer.read(64)
+    underruns = producer.underruns
+    assert not np.any(producer.read(64))
+    assert producer.underruns == underruns + 1
+    producer.stop()
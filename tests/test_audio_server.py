@@ -0,0 +1,24 @@
+'''
+AudioServer's audio process on a NullBackend, so no sound card is needed.
+Run from the repository root: python -m pytest
+'''
+
+import time
+
+from engine_sound_sim import audio_server
+from engine_sound_sim.audio_server import AudioServer
+
+def test_underruns_count_pcm_and_producer():
+    '''With ahead_ms, the PCM callback running dry still counts, the producer's count doesn't replace it'''
+    server = AudioServer(pcm_buffer_size=4096, ahead_ms=20, block_size=256, backend='null')
+    client = server.start()
+    try:
+        # Nothing is written, so every block the producer renders is short of samples
+        end = time.perf_counter() + 5
+        while client.underruns < 5 and time.perf_counter() < end:
+            time.sleep(0.02)
+        state = client._attach()
+        assert state[audio_server._UNDERRUNS] >= 5
+        assert client.underruns == int(state[audio_server._UNDERRUNS] + state[audio_server._PRODUCER_UNDERRUNS])
+    finally:
+        server.stop()
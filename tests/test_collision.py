@@ -0,0 +1,70 @@
+'''
+collision.WallGrid against checking every wall, which is what it replaces.
+Run from the repository root: python -m pytest
+'''
+
+import random
+
+import collision
+
+def _random_walls(rng, n, size=2000):
+    walls = []
+    for _ in range(n):
+        left, bottom = rng.uniform(-size, size), rng.uniform(-size, size)
+        walls.append((left, bottom, left + rng.choice((64, 64, 10, 300)), bottom + rng.choice((64, 64, 10, 300))))
+    return walls
+
+def _brute_force(walls, left, bottom, right, top):
+    return sorted(i for i, (wall_left, wall_bottom, wall_right, wall_top) in enumerate(walls)
+                  if wall_left < right and wall_right > left and wall_bottom < top and wall_top > bottom)
+
+def test_query_matches_brute_force():
+    rng = random.Random(1)
+    walls = _random_walls(rng, 300)
+    for cell_size in (16, 128, 1000):
+        grid = collision.WallGrid(walls, cell_size)
+        for _ in range(500):
+            left, bottom = rng.uniform(-2200, 2200), rng.uniform(-2200, 2200)
+            right, top = left + rng.uniform(0, 400), bottom + rng.uniform(0, 400)
+            hits = grid.query(left, bottom, right, top)
+            assert len(hits) == len(set(hits))
+            assert sorted(hits) == _brute_force(walls, left, bottom, right, top)
+            assert grid.collides(left, bottom, right, top) == bool(hits)
+
+def test_query_edges():
+    '''Walls on cell borders are found from either side, and touching a wall isn't overlapping it'''
+    grid = collision.WallGrid([(96, 96, 160, 160)], 128)
+    assert grid.query(100, 100, 110, 110) == [0]
+    assert grid.query(150, 150, 200, 200) == [0]
+    assert grid.query(160, 100, 200, 110) == []
+    assert grid.query(0, 0, 96, 96) == []
+
+def test_move_stops_at_walls():
+    grid = collision.WallGrid([(100, -50, 164, 50)])
+    assert grid.move(70, 0, 30, 0, 10, 10) == (90, 0)
+    assert grid.move(0, 0, 50, 0, 10, 10) == (50, 0)
+    assert grid.move(190, 0, -30, 0, 10, 10) == (174, 0)
+    # Along x first, then y: blocked on x, free to slide along y
+    assert grid.move(70, 0, 30, 30, 10, 10) == (90, 30)
+    # A box already in a wall can drive out of it
+    assert grid.move(110, 0, -50, 0, 10, 10) == (60, 0)
+    # Only where the box ends up is checked, like arcade.PhysicsEngineSimple, so a big enough step goes through
+    assert grid.move(0, 0, 200, 0, 10, 10) == (200, 0)
+
+def test_move_matches_brute_force():
+    '''The box never ends up overlapping a wall it wasn't already in, not even by rounding'''
+    rng = random.Random(2)
+    walls = _random_walls(rng, 200, 1000)
+    grid = collision.WallGrid(walls)
+    for _ in range(2000):
+        x, y = rng.uniform(-1000, 1000), rng.uniform(-1000, 1000)
+        half_width, half_height = collision.half_extent(40, 20, rng.uniform(0, 360))
+        before = _brute_force(walls, x - half_width, y - half_height, x + half_width, y + half_height)
+        x, y = grid.move(x, y, rng.uniform(-40, 40), rng.uniform(-40, 40), half_width, half_height)
+        after = _brute_force(walls, x - half_width, y - half_height, x + half_width, y + half_height)
+        assert set(after) <= set(before)
+
+def test_half_extent():
+    assert collision.half_extent(40, 20, 0) == (20, 10)
+    half_width, half_height = collision.half_extent(40, 20, 90)
+    assert abs(half_width - 10) < 1e-9 and abs(half_height - 20) < 1e-9
@@ -0,0 +1,92 @@
+'''
+Engine's cycle renderer against building one buffer per cylinder and summing them, which is how engine cycles
+were rendered before _scatter_cylinders.
+Run from the repository root: python -m pytest
+'''
+
+import numpy as np
+import pytest
+
+from engine_sound_sim import audio_tools, engine_factory
+from engine_sound_sim.engine import Engine
+
+RPMS = [400, 750, 1000, 3333.3, 7000, 9000.5, 12500, 15000]
+
+def _per_cylinder_cycle(engine, rpm):
+    '''One engine cycle of an engine with equal firing, one buffer per cylinder, like the original renderer'''
+    strokes_per_sec = rpm * 2 / 60
+    fire_duration = 1 / strokes_per_sec
+    between_fire_duration = fire_duration * (engine.strokes - 1)
+    fire_snd = audio_tools.slice(engine.fire_snd, fire_duration, engine.sample_rate)
+    bufs = []
+    for timing in engine.timing:
+        before_fire_duration = timing / 180 / strokes_per_sec
+        bufs.append(audio_tools.concat([
+            audio_tools.slice(engine.between_fire_snd, before_fire_duration, engine.sample_rate),
+            fire_snd,
+            audio_tools.slice(engine.between_fire_snd, between_fire_duration - before_fire_duration, engine.sample_rate),
+        ]))
+    max_buf_len = len(max(bufs, key=len))
+    bufs = [audio_tools.pad_with_zeros(buf, max_buf_len - len(buf)) for buf in bufs]
+    engine_snd = np.sum(bufs, axis=0)
+    audio_tools.normalize_volume(engine_snd)
+    return audio_tools.in_playback_format(engine_snd)
+
+def _equal_presets():
+    for name in engine_factory.names():
+        engine = engine_factory.create(name)
+        if not engine._has_unequal and engine.mode == 'cycle':
+            yield name
+
+@pytest.mark.parametrize('name', list(_equal_presets()))
+def test_cycle_matches_per_cylinder_buffers(name):
+    engine = engine_factory.create(name)
+    for rpm in RPMS:
+        engine.specific_rpm(rpm)
+        expected = _per_cylinder_cycle(engine, rpm)
+        np.testing.assert_array_equal(engine._gen_audio_one_engine_cycle(), expected, err_msg=f'{rpm} RPM')
+
+def _noisy_engine(dtype=np.float64):
+    '''An engine whose between_fire_snd isn't silent, so every part of a cylinder's sound is added'''
+    rng = np.random.default_rng(0)
+    return Engine(idle_rpm=800, limiter_rpm=7000, strokes=4, cylinders=4, timing=[180, 90, 180, 270],
+                  fire_snd=engine_factory.fire_snd(), between_fire_snd=rng.uniform(-0.1, 0.1, 44100), dtype=dtype)
+
+def test_cycle_with_between_fire_snd():
+    engine = _noisy_engine()
+    for rpm in RPMS:
+        engine.specific_rpm(rpm)
+        np.testing.assert_array_equal(engine._gen_audio_one_engine_cycle(), _per_cylinder_cycle(engine, rpm),
+                                      err_msg=f'{rpm} RPM')
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_scatter_cylinders_matches_sum_of_buffers(dtype):
+    '''Bit-identical to summing one padded buffer per cylinder in cylinder order, in the engine's mix dtype'''
+    engine = _noisy_engine(dtype)
+    between = engine.between_fire_snd
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        cylinders = int(rng.integers(1, 17))
+        fire_snd = engine._fire_snd_work[:int(rng.integers(0, 2000))]
+        num_before = rng.integers(0, 3000, cylinders)
+        num_after = rng.integers(0, 3000, cylinders)
+        length = int(np.max(num_before + len(fire_snd) + num_after))
+
+        out = np.zeros(length, dtype=dtype)
+        engine._scatter_cylinders(out, fire_snd, num_before, num_after)
+
+        expected = np.zeros(length, dtype=dtype)
+        for before, after in zip(num_before, num_after):
+            buf = np.concatenate([between[:before], fire_snd, between[:after]])
+            expected += audio_tools.pad_with_zeros(buf, length - len(buf))
+        np.testing.assert_array_equal(out, expected)
+
+def test_harmonic_tables_shared():
+    '''Engines with the same spec share one set of harmonic buckets, built once, and play the same'''
+    first = engine_factory.create('inline_4', mode='harmonic')
+    second = engine_factory.create('inline_4', mode='harmonic')
+    assert second._harmonic_sets is first._harmonic_sets
+    assert engine_factory.create('V_12', mode='harmonic')._harmonic_sets is not first._harmonic_sets
+    for engine in (first, second):
+        engine.specific_rpm(5000)
+    np.testing.assert_array_equal(first.gen_audio(512), second.gen_audio(512))
@@ -0,0 +1,32 @@
+'''
+Mixer source bookkeeping: removed sources must never be rendered, whatever min_gain is.
+Run from the repository root: python -m pytest
+'''
+
+import numpy as np
+import pytest
+
+from engine_sound_sim import engine_factory
+from engine_sound_sim.mixer import Mixer
+
+@pytest.mark.parametrize('min_gain', [0, 1e-3])
+@pytest.mark.parametrize('channels', [1, 2])
+def test_remove_then_render(min_gain, channels):
+    mixer = Mixer(min_gain=min_gain, channels=channels)
+    first = mixer.add(engine_factory.create('inline_4'))
+    mixer.add(engine_factory.create('inline_6'))
+    mixer.remove(first)
+    assert len(mixer) == 1
+    assert len(mixer.gen_audio(256)) == 256 * channels
+    assert mixer.rendered_sources == 1
+
+    # The empty slot is reused, and rendered again once it has an engine
+    assert mixer.add(engine_factory.create('V_12')) == first
+    mixer.gen_audio(256)
+    assert mixer.rendered_sources == 2
+
+def test_all_removed_is_silent():
+    mixer = Mixer(min_gain=0)
+    mixer.remove(mixer.add(engine_factory.create('inline_4')))
+    assert not np.any(mixer.gen_audio(256))
+    assert mixer.rendered_sources == 0
@@ -0,0 +1,174 @@
+'''
+simulation.step() against the per-frame physics MyGame.on_update used to do itself, step_cars() against step(),
+and the fixed timestep.
+Run from the repository root: python -m pytest
+'''
+
+import math
+import random
+
+import numpy as np
+
+import simulation
+
+class _OldCar:
+    '''The fields of the player sprite the old on_update read and wrote'''
+    def __init__(self, x, y):
+        self.center_x = x
+        self.center_y = y
+        self.angle = 0.0
+        self.speed = 0.0
+        self.change_x = 0.0
+        self.change_y = 0.0
+        self.gear = 0
+        self.rpm = 750
+        self.throttle = 0
+        self.brake = 0
+        self.steering = 0
+        self.torque = 0.0
+        self.power = 0.0
+
+def _old_shift(car, direction):
+    '''Gear changes from the old on_key_press (Q and E)'''
+    if direction < 0:
+        car.gear -= 1 if car.gear > 0 or car.speed < 0.5 and car.gear > -1 else 0
+    elif direction > 0:
+        car.gear += 1 if car.gear < 0 or car.speed > -0.5 and car.gear < 7 else 0
+
+def _old_update(car, throttle, brake, steering):
+    '''One frame of the old on_update, with arcade.PhysicsEngineSimple moving the sprite and no walls'''
+    car.throttle = throttle
+    car.brake = brake
+    car.steering = steering
+    car.angle += (
+        (car.steering / (abs(car.speed) / 3 * 40 / 550))
+        if abs(car.steering * car.speed * 0.8) > 5
+        else car.steering * car.speed * 0.8
+    )
+
+    car.torque = 40 * (1 - (car.gear if car.gear != 0 else 1) / 8)
+    car.power = 40 * ((car.gear if car.gear != 0 else 1) / 8)
+    if car.gear:
+        car.rpm = car.speed / (car.power + 0.000001) * 12500 if abs(car.speed) > 0 else 750
+    else:
+        if car.throttle and car.rpm < 12500:
+            car.rpm += 800 if car.rpm < 12000 else 300 if car.rpm < 13000 else 0
+        if car.rpm >= 750:
+            car.rpm -= 150
+        else:
+            car.rpm = 750
+
+    if car.throttle and car.gear:
+        car.speed += car.torque * 0.005
+    if car.speed > car.power and car.gear:
+        car.speed -= (car.speed - car.power) / (3 - car.throttle)
+    car.speed *= 0.998
+    if car.brake:
+        brake_coef = 0.2 if abs(car.speed) > 0.2 * 1.1 else abs(car.speed)
+        if car.speed > 0:
+            car.speed -= brake_coef
+        elif car.speed < 0:
+            car.speed += brake_coef
+
+    car.change_x = car.speed * math.cos(math.radians(car.angle))
+    car.change_y = car.speed * math.sin(math.radians(car.angle))
+    car.angle += -360 if car.angle > 360 else +360 if car.angle < 0 else 0
+    car.center_x += car.change_x
+    car.center_y += car.change_y
+
+def _random_inputs(rng, steps):
+    '''Held inputs changing now and then, with the odd gear change, like someone driving'''
+    inputs = []
+    throttle = brake = steering = 0
+    for _ in range(steps):
+        if rng.random() < 0.05:
+            throttle = rng.choice((0, 1, 1))
+            brake = rng.choice((0, 0, 0, 1))
+            steering = rng.choice((-1, 0, 0, 1))
+        shift = rng.choice((-1, 1)) if rng.random() < 0.02 else 0
+        inputs.append(simulation.Inputs(throttle, brake, steering, shift))
+    return inputs
+
+def test_step_matches_old_on_update():
+    rng = random.Random(1)
+    for _ in range(20):
+        old = _OldCar(5000.0, 520.0)
+        state = simulation.CarState(5000.0, 520.0)
+        for inputs in _random_inputs(rng, 600):
+            if inputs.shift:
+                _old_shift(old, inputs.shift)
+            _old_update(old, inputs.throttle, inputs.brake, inputs.steering)
+            simulation.step(state, inputs)
+            for name in ('angle', 'speed', 'change_x', 'change_y', 'gear', 'rpm', 'torque', 'power'):
+                assert getattr(state, name) == getattr(old, name), name
+            assert (state.x, state.y) == (old.center_x, old.center_y)
+
+def test_run_is_repeated_step():
+    inputs = _random_inputs(random.Random(2), 300)
+    state = simulation.CarState()
+    for step_inputs in inputs:
+        simulation.step(state, step_inputs)
+    ran = simulation.run(simulation.CarState(), inputs)
+    for name in simulation.CarState.__slots__:
+        assert getattr(ran, name) == getattr(state, name), name
+
+def test_smaller_timestep_stays_close():
+    '''Two steps of half DT end up near one step of DT, within a few percent after 2 seconds of accelerating'''
+    inputs = [simulation.Inputs(throttle=1, shift=1 if i == 0 else 0) for i in range(120)]
+    full = simulation.run(simulation.CarState(), inputs)
+    half_inputs = [half for step_inputs in inputs for half in (step_inputs, step_inputs._replace(shift=0))]
+    half = simulation.run(simulation.CarState(), half_inputs, simulation.DT / 2)
+    assert math.isclose(half.speed, full.speed, rel_tol=0.05)
+    assert math.isclose(half.x, full.x, rel_tol=0.05)
+
+def test_fixed_timestep():
+    timestep = simulation.FixedTimestep(0.25) # exact in binary, so the leftover time is too
+    assert len(timestep.advance(0.625)) == 2
+    assert len(timestep.advance(0.125)) == 1
+    assert len(timestep.advance(0)) == 0
+    assert len(timestep.advance(10)) == 10 # capped, and the rest dropped
+    assert len(timestep.advance(0)) == 0
+
+def _step_each(states, inputs, dt=simulation.DT):
+    for i, state in enumerate(states):
+        simulation.step(state, simulation.Inputs(*(int(field[i]) for field in inputs)), dt)
+
+def test_step_cars_matches_step():
+    '''A grid of cars with different inputs each, stepped together, ends up bit-identical to stepping each one'''
+    rng = random.Random(3)
+    n = 16
+    drives = [_random_inputs(rng, 600) for _ in range(n)]
+    states = [simulation.CarState(100.0 * i, 50.0, 90.0) for i in range(n)]
+    cars = simulation.Cars(n, x=np.arange(n) * 100.0, y=50.0, angle=90.0)
+    for step in range(600):
+        inputs = simulation.Inputs(*(np.array(field) for field in zip(*(drive[step] for drive in drives))))
+        simulation.step_cars(cars, inputs)
+        _step_each(states, inputs)
+        for i, state in enumerate(states):
+            for name in simulation.CarState.__slots__:
+                assert getattr(cars, name)[i] == getattr(state, name), (step, i, name)
+
+def test_step_cars_single_inputs():
+    '''Inputs given as single values apply to every car'''
+    cars = simulation.Cars(3)
+    state = simulation.CarState()
+    for step in range(200):
+        inputs = simulation.Inputs(throttle=1, steering=1 if step > 100 else 0, shift=1 if step % 50 == 0 else 0)
+        simulation.step_cars(cars, inputs)
+        simulation.step(state, inputs)
+    for i in range(3):
+        for name in simulation.CarState.__slots__:
+            assert getattr(cars.state(i), name) == getattr(state, name), name
+
+def test_cars_add_and_state():
+    state = simulation.CarState(1.0, 2.0, 3.0)
+    state.gear = 2
+    cars = simulation.Cars()
+    assert cars.add(state) == 0
+    assert cars.add() == 1
+    assert len(cars) == 2
+    copy = cars.state(0)
+    for name in simulation.CarState.__slots__:
+        assert getattr(copy, name) == getattr(state, name), name
+    cars.set_state(1, state)
+    assert cars.state(1).gear == 2
@@ -0,0 +1,16 @@
+'''
+The soak test without a sound card renders on a simulated clock, so it has to give the same audio every run.
+Run from the repository root: python -m pytest
+'''
+
+import pytest
+
+from engine_sound_sim import soak
+
+@pytest.mark.parametrize('ahead_ms', [None, 50])
+def test_same_seed_same_audio(tmp_path, ahead_ms):
+    paths = [tmp_path / 'first.wav', tmp_path / 'second.wav']
+    for path in paths:
+        snapshot, _ = soak.run('inline_4', seconds=3, block_size=512, ahead_ms=ahead_ms, path=path, seed=1)
+        assert snapshot['producer_underruns'] == 0
+    assert paths[0].read_bytes() == paths[1].read_bytes()
@@ -0,0 +1,32 @@
+'''
+Shared sounds, and engines built from them at sample rates other than cfg.sample_rate.
+Run from the repository root: python -m pytest
+'''
+
+import math
+
+import numpy as np
+import pytest
+
+from engine_sound_sim import cfg, engine_factory, sound_bank
+
+@pytest.mark.parametrize('length, from_rate, to_rate', [(1000, 3, 7), (44100, 44100, 47999), (44099, 44100, 8001),
+                                                        (44101, 44100, 96001), (10, 7, 3)])
+def test_resampled_lasts_as_long(length, from_rate, to_rate):
+    snd = np.linspace(-1, 1, length)
+    resampled = sound_bank.resampled(snd, from_rate, to_rate)
+    assert len(resampled) == math.ceil(length * to_rate / from_rate)
+    assert len(resampled) / to_rate >= length / from_rate
+    assert resampled[0] == snd[0]
+    assert not resampled.flags.writeable
+
+@pytest.mark.parametrize('sample_rate', [7919, 8000, 11025, 22051, 32000, 44099, 44101, 47999, 48000, 96001])
+def test_presets_at_any_sample_rate(sample_rate):
+    engine = engine_factory.create('inline_4', sample_rate=sample_rate)
+    assert engine.sample_rate == sample_rate
+    assert len(engine.fire_snd) >= sample_rate
+    assert len(engine.gen_audio(256)) == 256
+
+def test_same_rate_is_unchanged():
+    snd = engine_factory.fire_snd()
+    assert sound_bank.resampled(snd, cfg.sample_rate, cfg.sample_rate) is snd
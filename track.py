@@ -0,0 +1,90 @@
+'''
+Where the track is, from an image of it (e.g. img/monzaoutline.png): one bit per pixel, packed 8 to a byte,
+worked out once when the image is loaded and optionally cached on disk. Testing a point is then an array
+lookup, for any number of points (every corner of every car) at once.
+
+World coordinates have y going up with the image's bottom left corner at `origin`, and `scale` world pixels
+to an image pixel, like an arcade.Sprite of the image drawn at that scale.
+'''
+
+import os
+import numpy as np
+
+class Bitmask:
+    def __init__(self, bits, width, height, scale=1.0, origin=(0.0, 0.0)):
+        '''
+        bits: (height, ceil(width / 8)) uint8 array from np.packbits(..., axis=1, bitorder='little'),
+          row 0 is the top of the image
+        width, height: in image pixels
+        '''
+        assert bits.shape == (height, (width + 7) // 8), 'bits are the wrong shape for width and height'
+        assert scale > 0, 'scale <= 0'
+        self.bits = bits
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.origin = origin
+
+    @classmethod
+    def from_mask(cls, mask, scale=1.0, origin=(0.0, 0.0)):
+        '''From a (height, width) boolean array, row 0 at the top'''
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask, axis=1, bitorder='little'), mask.shape[1], mask.shape[0], scale, origin)
+
+    @classmethod
+    def load(cls, path, scale=1.0, origin=(0.0, 0.0), max_brightness=128, cache=None):
+        '''
+        Mask of the opaque pixels of the image at `path` darker than `max_brightness` (0-255, the mean of
+        red, green and blue). In img/monzaoutline.png the tarmac is dark and the infield light, so the
+        default is the track itself, and max_brightness=256 is everything inside its outline.
+
+        cache: .npz file to keep the mask in. It's rebuilt when the image or max_brightness changes,
+          otherwise loading it skips decoding the image
+        '''
+        stat = os.stat(path)
+        key = np.array([stat.st_mtime_ns, stat.st_size, max_brightness], dtype=np.int64)
+        if cache is not None and os.path.exists(cache):
+            with np.load(cache) as cached:
+                if np.array_equal(cached['key'], key):
+                    height, width = cached['shape']
+                    return cls(cached['bits'], int(width), int(height), scale, origin)
+
+        rgba = _read_rgba(path)
+        mask = rgba[..., 3] >= 128
+        if max_brightness <= 255:
+            mask &= rgba[..., :3].mean(axis=2) < max_brightness
+        bitmask = cls.from_mask(mask, scale, origin)
+        if cache is not None:
+            np.savez(cache, key=key, shape=np.array(mask.shape), bits=bitmask.bits)
+        return bitmask
+
+    @property
+    def size(self):
+        '''(width, height) in world pixels'''
+        return self.width * self.scale, self.height * self.scale
+
+    def contains(self, x, y):
+        '''Whether each point (x, y) is on the mask, numbers or arrays of any shape. Off the image is False'''
+        columns = np.floor((np.asarray(x) - self.origin[0]) / self.scale).astype(np.intp)
+        rows = self.height - 1 - np.floor((np.asarray(y) - self.origin[1]) / self.scale).astype(np.intp)
+        inside = (columns >= 0) & (columns < self.width) & (rows >= 0) & (rows < self.height)
+        columns = np.where(inside, columns, 0)
+        rows = np.where(inside, rows, 0)
+        return inside & (self.bits[rows, columns >> 3] >> (columns & 7) & 1).astype(bool)
+
+def corners(x, y, angle, width, height):
+    '''
+    x and y of the 4 corners of width x height rectangles centred on (x, y) and turned `angle` degrees,
+    each an array with a last axis of 4. x, y and angle can be arrays, e.g. a simulation.Cars' fields.
+    '''
+    radians = np.radians(np.asarray(angle, dtype=np.float64))[..., np.newaxis]
+    along = np.array([1, 1, -1, -1]) * (width / 2)
+    across = np.array([1, -1, -1, 1]) * (height / 2)
+    cos, sin = np.cos(radians), np.sin(radians)
+    return (np.asarray(x)[..., np.newaxis] + along * cos - across * sin,
+            np.asarray(y)[..., np.newaxis] + along * sin + across * cos)
+
+def _read_rgba(path):
+    from PIL import Image # comes with arcade
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGBA'))
@@ -0,0 +1,87 @@
+'''
+A world split into square chunks, each loaded (e.g. into an arcade.SpriteList) when the camera gets near it
+and dropped again, least recently used first, once more than `max_chunks` are loaded. Only chunks in view
+are drawn, so startup time and memory stay the same however big the map is. Chunks around the view are loaded
+a few per frame before they come into view, so crossing into new chunks doesn't stall a frame.
+'''
+
+import math
+from collections import OrderedDict
+
+class ChunkedWorld:
+    def __init__(self, load_chunk, chunk_size=1024, max_chunks=24, margin=None, max_loads=1):
+        '''
+        load_chunk: function (left, bottom, right, top) -> what's in that part of the world, anything with
+          a draw() method (e.g. an arcade.SpriteList), or None if there's nothing there
+        chunk_size: width and height of a chunk, in world pixels
+        max_chunks: most chunks kept loaded. More are kept if that many are needed around the view
+        margin: how far past the edges of the view chunks are loaded before they're needed,
+          defaults to half a chunk
+        max_loads: most chunks loaded ahead of being needed per update(), nearest to the view first.
+          Chunks in view are always loaded straight away
+        '''
+        assert chunk_size > 0, 'chunk_size <= 0'
+        assert max_loads >= 0, 'max_loads < 0'
+        self.load_chunk = load_chunk
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.margin = chunk_size / 2 if margin is None else margin
+        self.max_loads = max_loads
+
+        self._chunks = OrderedDict() # (column, row) -> loaded chunk, least recently used first
+        self._visible = []
+        self.loads = 0 # chunks loaded so far, including reloads of evicted ones
+        self.evictions = 0
+
+    def __len__(self):
+        '''Number of chunks loaded'''
+        return len(self._chunks)
+
+    def chunks_in(self, left, bottom, right, top):
+        '''(column, row) of every chunk overlapping the rectangle'''
+        size = self.chunk_size
+        columns = range(math.floor(left / size), math.floor(right / size) + 1)
+        return [(column, row) for row in range(math.floor(bottom / size), math.floor(top / size) + 1)
+                for column in columns]
+
+    def update(self, left, bottom, width, height):
+        '''
+        Makes sure the chunks in the view with its bottom left corner at (left, bottom) are loaded, e.g. from
+        camera.position and the window size, loads up to max_loads of the ones around it, and evicts the least
+        recently used ones past max_chunks
+        '''
+        margin = self.margin
+        visible = self.chunks_in(left, bottom, left + width, bottom + height)
+        nearby = self.chunks_in(left - margin, bottom - margin, left + width + margin, bottom + height + margin)
+        chunks = self._chunks
+        for key in visible:
+            if key not in chunks:
+                self._load(key)
+
+        # Chunks around the view, nearest to its centre first
+        size = self.chunk_size
+        centre_column, centre_row = (left + width / 2) / size - 0.5, (bottom + height / 2) / size - 0.5
+        missing = sorted((key for key in nearby if key not in chunks),
+                         key=lambda key: (key[0] - centre_column)**2 + (key[1] - centre_row)**2)
+        for key in missing[:self.max_loads]:
+            self._load(key)
+
+        for key in nearby:
+            if key in chunks:
+                chunks.move_to_end(key)
+        while len(chunks) > max(self.max_chunks, len(nearby)):
+            chunks.popitem(last=False)
+            self.evictions += 1
+        self._visible = [chunks[key] for key in visible]
+
+    def _load(self, key):
+        column, row = key
+        size = self.chunk_size
+        self._chunks[key] = self.load_chunk(column * size, row * size, (column + 1) * size, (row + 1) * size)
+        self.loads += 1
+
+    def draw(self):
+        '''Draws the chunks in view at the last update()'''
+        for chunk in self._visible:
+            if chunk is not None:
+                chunk.draw()